@@ -1,12 +1,189 @@
+import time
+
+# Відлік холодного запуску починається до решти імпортів, щоб --startup-time враховував і їх
+STARTED_AT = time.perf_counter()
+
 import tkinter as tk
 from tkinter import messagebox, ttk
 import sqlite3
 import datetime
+import csv
+import hashlib
+import hmac
+import html
+import json
+import math
+import os
+import queue
+import re
+import secrets
+import sys
+from collections import deque, namedtuple
+from pathlib import Path
+
+
+# Розмір сторінки редактора; вибірки на кілька сторінок сортуються засобами SQL
+MATERIAL_PAGE_SIZE = 5000
+# Розмір кешу підготовлених запитів з'єднання (sqlite3.connect(cached_statements=...))
+STATEMENT_CACHE_SIZE = 256
+# Яка частка триграм запиту має збігтися, щоб деталь потрапила в результати пошуку
+TRIGRAM_SIMILARITY_THRESHOLD = 0.4
+# Режим сканування: як часто зберігати накопичені скани і скільки позицій у одній транзакції
+SCAN_FLUSH_INTERVAL_MS = 500
+SCAN_BATCH_SIZE = 20
+# Каталог нічних звітів по стелажах і файл зі станом попереднього запуску
+REPORTS_DIR = "reports"
+REPORT_STATE_FILE = "report_state.json"
+WRITE_OFF_STATUS = "В очікуванні списання"
+# Версія схеми бази (PRAGMA user_version); збільшувати при кожній зміні DDL
+SCHEMA_VERSION = 1
+# Бажаний час холодного запуску до появи першого екрана, секунд
+STARTUP_BUDGET_SECONDS = 1.0
+# Параметри хешування паролів (PBKDF2-HMAC-SHA256) і тривалість сесії після входу
+PASSWORD_HASH_ALGORITHM = "pbkdf2_sha256"
+PASSWORD_HASH_ITERATIONS = 600000
+SESSION_LIFETIME_SECONDS = 8 * 60 * 60
+# Скільки груп операцій редактора можна скасувати
+JOURNAL_LIMIT = 200
+# Гістограма часу у статусі: кожен інтервал [2^k, 2^(k+1)) секунд ділиться на 2^bits рівних кошиків
+DURATION_SUB_BUCKET_BITS = 4
+# Розмір порції рядків для перевірки цілісності на робочій базі
+CONSISTENCY_CHUNK_SIZE = 5000
+STATUS_VALUES = ["Справний", "Несправний", "Підлягає ремонту", "Очікує діагностики", "В очікуванні списання", "Списаний"]
+
+
+MaterialRow = namedtuple("MaterialRow", "material_id name quantity catalog_number date_registered status")
+DeletedMaterialRow = namedtuple("DeletedMaterialRow", MaterialRow._fields + ("date_deleted",))
+ShelfRow = namedtuple("ShelfRow", "shelf_id description")
+
+
+def hash_password(password, salt=None, iterations=PASSWORD_HASH_ITERATIONS):
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{PASSWORD_HASH_ALGORITHM}${iterations}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password, stored):
+    # Повертає (пароль вірний, чи потрібно перехешувати запис)
+    if stored is None or password is None:
+        return False, False
+    parts = stored.split("$")
+    if len(parts) != 4 or parts[0] != PASSWORD_HASH_ALGORITHM:
+        # Старий запис із паролем у відкритому вигляді
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")), True
+    try:
+        iterations, salt = int(parts[1]), bytes.fromhex(parts[2])
+        ok = hmac.compare_digest(hash_password(password, salt, iterations), stored)
+    except (ValueError, OverflowError):
+        # Пошкоджений запис хешу вважається невдалим входом
+        return False, False
+    return ok, ok and iterations < PASSWORD_HASH_ITERATIONS
+
+
+# Хеш, з яким звіряється пароль невідомого користувача, щоб відповідь тривала стільки ж, як і для відомого
+DUMMY_PASSWORD_HASH = f"{PASSWORD_HASH_ALGORITHM}${PASSWORD_HASH_ITERATIONS}${'00' * 16}${'00' * 32}"
+
+
+def _numeric_key(value):
+    try:
+        return (0, float(value))
+    except (TypeError, ValueError):
+        return (1, str(value))
+
+
+def _date_key(value):
+    try:
+        return (0, datetime.datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S"))
+    except ValueError:
+        return (1, str(value))
+
+
+def trigrams(text):
+    result = set()
+    for word in re.findall(r"\w+", str(text).casefold()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def inner_trigrams(text):
+    # Триграми всередині слів без доповнення пробілами: вони є в індексі будь-якого тексту,
+    # що містить слово як підрядок, зокрема всередині довшого слова
+    result = set()
+    for word in re.findall(r"\w+", str(text).casefold()):
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+def _casefold(value):
+    return None if value is None else str(value).casefold()
+
+
+def material_sort_keys(values):
+    material_id, name, quantity, catalog_number, date_registered, status = values[:6]
+    return (
+        _numeric_key(material_id),
+        str(name).casefold(),
+        _numeric_key(quantity),
+        str(catalog_number).casefold(),
+        _date_key(date_registered),
+        str(status),
+    )
+
+
+def sort_by_keys(items, key_of, sort_order):
+    # sort_order — [(індекс колонки, за спаданням)], перший ключ головний;
+    # стабільне сортування від молодшого ключа до головного
+    items = list(items)
+    for col_index, descending in reversed(sort_order):
+        items.sort(key=lambda item: key_of(item)[col_index], reverse=descending)
+    return items
+
+
+def move_group(rows, from_shelf_id, to_shelf_id, quantity=None):
+    # Група операцій журналу для переміщення обраних рядків редактора; quantity — введена кількість,
+    # якщо обрано один рядок. Рядок з нечисловою або нульовою кількістю переміщується цілим ("move"):
+    # перенесення частини з нього неможливе і відкотило б усю групу
+    group = []
+    for values in rows:
+        material_id, available = int(values[0]), str(values[2])
+        if not available.isdigit() or int(available) == 0:
+            group.append(("move", material_id, from_shelf_id, to_shelf_id))
+        elif len(rows) == 1:
+            if not quantity.isdigit() or not 0 < int(quantity) <= int(available):
+                raise ValueError(f"Кількість має бути числом від 1 до {available}.")
+            group.append(("transfer", material_id, from_shelf_id, to_shelf_id, int(quantity)))
+        else:
+            group.append(("transfer", material_id, from_shelf_id, to_shelf_id, int(available)))
+    return group
+
+
+def duration_bucket(seconds):
+    # Лог-лінійний кошик: до 2^bits секунд — по одній секунді, далі відносна ширина не більше 1/2^bits
+    value = int(seconds)
+    if value < 1 << DURATION_SUB_BUCKET_BITS:
+        return value
+    exponent = value.bit_length() - 1
+    shift = exponent - DURATION_SUB_BUCKET_BITS
+    return ((shift + 1) << DURATION_SUB_BUCKET_BITS) + (value >> shift) - (1 << DURATION_SUB_BUCKET_BITS)
+
+
+def duration_bucket_bounds(bucket):
+    # Межі кошика [нижня, верхня) у секундах
+    sub_buckets = 1 << DURATION_SUB_BUCKET_BITS
+    if bucket < sub_buckets:
+        return float(bucket), float(bucket + 1)
+    shift = (bucket >> DURATION_SUB_BUCKET_BITS) - 1
+    mantissa = sub_buckets + bucket % sub_buckets
+    return float(mantissa << shift), float((mantissa + 1) << shift)
 
 
 class Database:
     def __init__(self, db_file):
-        self.connection = sqlite3.connect(db_file)
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file, cached_statements=STATEMENT_CACHE_SIZE)
+        # Вбудований LOWER() у SQLite змінює регістр лише латиниці
+        self.connection.create_function("casefold", 1, _casefold, deterministic=True)
         self.cursor = self.connection.cursor()
 
     def execute_query(self, query, params=()):
@@ -40,18 +217,32 @@ class DatabaseSetup:
         self.connection = db.connection
         self.cursor = self.connection.cursor()
         self.db = db
-        self.create_tables()
-        
+        self.upgraded = False
+        # Якщо версія схеми актуальна, DDL під час запуску не виконується
+        if self.cursor.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.create_tables()
+            self.upgraded = True
 
     def create_tables(self):
-        self.db.execute_query("""
+        # Уся схема створюється однією транзакцією разом з оновленням user_version
+        self.cursor.execute("BEGIN")
+        try:
+            self._create_tables()
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+
+    def _create_tables(self):
+        self.cursor.execute("""
         CREATE TABLE IF NOT EXISTS Shelves (
             shelf_id INTEGER PRIMARY KEY AUTOINCREMENT,
             shelf_number INTEGER UNIQUE,
             description TEXT
         )
         """)
-        self.db.execute_query("""
+        self.cursor.execute("""
         CREATE TABLE IF NOT EXISTS Users (
             user_id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE,
@@ -61,7 +252,7 @@ class DatabaseSetup:
         """)
         
        
-        self.db.execute_query("""
+        self.cursor.execute("""
         CREATE TABLE IF NOT EXISTS Materials (
             material_id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
@@ -73,8 +264,89 @@ class DatabaseSetup:
             FOREIGN KEY (shelf_id) REFERENCES Shelves(shelf_id)
         )
         """)
-       
-        self.db.execute_query("""
+        # Індекси для сортування великих вибірок у редакторі стелажу
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_shelf_name ON Materials (shelf_id, name)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_shelf_date ON Materials (shelf_id, date_registered)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_shelf_status ON Materials (shelf_id, status)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_materials_shelf_catalog ON Materials (shelf_id, purpose)")
+
+        # Лічильник змін кожного стелажу — за ним звіти перегенеровуються лише для змінених стелажів
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ShelfRevisions (
+            shelf_id INTEGER PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        bump = """
+            INSERT INTO ShelfRevisions (shelf_id, revision) VALUES ({row}.shelf_id, 1)
+            ON CONFLICT (shelf_id) DO UPDATE SET revision = revision + 1;
+        """
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_materials_insert_revision AFTER INSERT ON Materials
+        BEGIN {bump.format(row="NEW")} END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_materials_update_revision AFTER UPDATE ON Materials
+        BEGIN {bump.format(row="OLD")} {bump.format(row="NEW")} END
+        """)
+        self.cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_materials_delete_revision AFTER DELETE ON Materials
+        BEGIN {bump.format(row="OLD")} END
+        """)
+
+        # Історія змін статусу та попередньо обчислені агрегати часу перебування у статусі
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS StatusHistory (
+            history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            material_id INTEGER,
+            shelf_id INTEGER,
+            old_status TEXT,
+            new_status TEXT,
+            changed_at TEXT
+        )
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_status_history_material ON StatusHistory (material_id)")
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS StatusDurations (
+            shelf_id INTEGER,
+            status TEXT,
+            bucket INTEGER,
+            transitions INTEGER NOT NULL DEFAULT 0,
+            total_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (shelf_id, status, bucket)
+        ) WITHOUT ROWID
+        """)
+
+        # Журнал переміщень: кожне (часткове) переміщення — один компактний запис
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS MovementLedger (
+            movement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            moved_at TEXT,
+            source_material_id INTEGER,
+            target_material_id INTEGER,
+            from_shelf_id INTEGER,
+            to_shelf_id INTEGER,
+            quantity INTEGER
+        )
+        """)
+
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ConsistencyCheckpoints (
+            check_name TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL
+        )
+        """)
+        # Проблеми, знайдені в уже перевірених порціях незавершеного проходу
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ConsistencyFindings (
+            check_name TEXT,
+            table_name TEXT,
+            row_id INTEGER,
+            PRIMARY KEY (check_name, row_id)
+        ) WITHOUT ROWID
+        """)
+
+        self.cursor.execute("""
         CREATE TABLE IF NOT EXISTS DeletedMaterials (
             material_id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
@@ -88,55 +360,1065 @@ class DatabaseSetup:
         )
         """)
 
-       
+        # Триграмний індекс назв і каталогових номерів для нечіткого пошуку
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS MaterialTrigrams (
+            shelf_id INTEGER,
+            trigram TEXT,
+            material_id INTEGER,
+            PRIMARY KEY (shelf_id, trigram, material_id)
+        ) WITHOUT ROWID
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_material_trigrams_material ON MaterialTrigrams (material_id)")
+        # Пошук обмежений стелажем, тож записи індексу переїжджають разом з деталлю
+        self.cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_materials_move_trigrams AFTER UPDATE OF shelf_id ON Materials
+        WHEN NEW.shelf_id IS NOT OLD.shelf_id
+        BEGIN UPDATE MaterialTrigrams SET shelf_id = NEW.shelf_id WHERE material_id = NEW.material_id; END
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS MaterialTrigramCounts (
+            material_id INTEGER PRIMARY KEY,
+            trigram_count INTEGER
+        )
+        """)
+
+
+class TrigramIndex:
+    def __init__(self, db):
+        self.db = db
+
+    def ensure_built(self):
+        indexed, total = self.db.fetch_one(QueryRegistry.statement("trigram_index_size"))
+        if indexed != total:
+            self.rebuild()
+
+    def rebuild(self):
+        self.db.execute_query("DELETE FROM MaterialTrigrams")
+        self.db.execute_query("DELETE FROM MaterialTrigramCounts")
+        for material_id, shelf_id, name, quantity, catalog_number in self.db.fetch_all(
+            QueryRegistry.statement("materials_to_index")
+        ):
+            self._insert(material_id, shelf_id, name, quantity, catalog_number)
+        self.db.connection.commit()
+
+    def index_material(self, material_id, commit=True):
+        # Індексує рядок у поточному стані; викликається після кожної зміни назви, кількості чи номера
+        self.db.cursor.execute("DELETE FROM MaterialTrigrams WHERE material_id = ?", (material_id,))
+        self.db.cursor.execute(QueryRegistry.statement("material_to_index"), (material_id,))
+        row = self.db.cursor.fetchone()
+        if row is None:
+            self.db.cursor.execute("DELETE FROM MaterialTrigramCounts WHERE material_id = ?", (material_id,))
+        else:
+            self._insert(material_id, *row)
+        if commit:
+            self.db.connection.commit()
+
+    def remove_material(self, material_id, commit=True):
+        self.db.cursor.execute("DELETE FROM MaterialTrigrams WHERE material_id = ?", (material_id,))
+        self.db.cursor.execute("DELETE FROM MaterialTrigramCounts WHERE material_id = ?", (material_id,))
+        if commit:
+            self.db.connection.commit()
+
+    def remove_shelf(self, shelf_id):
+        subquery = "SELECT material_id FROM Materials WHERE shelf_id = ?"
+        self.db.cursor.execute("DELETE FROM MaterialTrigrams WHERE shelf_id = ?", (shelf_id,))
+        self.db.execute_query(f"DELETE FROM MaterialTrigramCounts WHERE material_id IN ({subquery})", (shelf_id,))
+
+    def _insert(self, material_id, shelf_id, name, quantity, catalog_number):
+        material_trigrams = trigrams(name) | trigrams(quantity) | trigrams(catalog_number)
+        self.db.cursor.executemany(
+            "INSERT OR IGNORE INTO MaterialTrigrams (shelf_id, trigram, material_id) VALUES (?, ?, ?)",
+            [(shelf_id, trigram, material_id) for trigram in material_trigrams],
+        )
+        self.db.cursor.execute(
+            "INSERT OR REPLACE INTO MaterialTrigramCounts (material_id, trigram_count) VALUES (?, ?)",
+            (material_id, len(material_trigrams)),
+        )
+
+    # Точний збіг: запит є підрядком назви, кількості або каталогового номера
+    SUBSTRING_CONDITION = (
+        "(instr(casefold(name), ?) > 0 OR instr(CAST(material_type AS TEXT), ?) > 0 OR instr(casefold(purpose), ?) > 0)"
+    )
+
+    def match_clause(self, text, shelf_id, threshold=TRIGRAM_SIMILARITY_THRESHOLD):
+        # Повертає підзапит (material_id, hits, exact) з кандидатами на стелажі: нечіткі збіги,
+        # де hits — кількість спільних триграм, і точні збіги підрядка (exact = 1)
+        needle = text.casefold()
+        parts, params = [], []
+        query_trigrams = sorted(trigrams(text))
+        if query_trigrams:
+            placeholders = ", ".join("?" * len(query_trigrams))
+            parts.append(f"SELECT material_id, COUNT(*) AS hits, 0 AS exact FROM MaterialTrigrams "
+                         f"WHERE shelf_id = ? AND trigram IN ({placeholders}) "
+                         "GROUP BY material_id HAVING COUNT(*) >= ?")
+            params += [shelf_id, *query_trigrams, max(1, math.ceil(threshold * len(query_trigrams)))]
+        required = sorted(inner_trigrams(text))
+        if required:
+            # Кандидати на точний збіг мають містити всі внутрішні триграми запиту; підрядок перевіряється лише в них
+            placeholders = ", ".join("?" * len(required))
+            parts.append(f"SELECT material_id, 0 AS hits, 1 AS exact FROM Materials WHERE material_id IN ("
+                         f"SELECT material_id FROM MaterialTrigrams WHERE shelf_id = ? AND trigram IN ({placeholders}) "
+                         f"GROUP BY material_id HAVING COUNT(*) = ?) AND {self.SUBSTRING_CONDITION}")
+            params += [shelf_id, *required, len(required), needle, needle, needle]
+        else:
+            # Запит коротший за триграму (наприклад, "8" чи "10") — перевіряються всі рядки стелажу
+            parts.append(f"SELECT material_id, 0 AS hits, 1 AS exact FROM Materials WHERE shelf_id = ? AND {self.SUBSTRING_CONDITION}")
+            params += [shelf_id, needle, needle, needle]
+        subquery = ("SELECT material_id, MAX(hits) AS hits, MAX(exact) AS exact FROM ("
+                    + " UNION ALL ".join(parts) + ") GROUP BY material_id")
+        return subquery, tuple(params)
+
+
+class QueryRegistry:
+    # Іменовані параметризовані запити: назва -> (SQL, тип рядка результату, зразок параметрів для --explain-queries)
+    MATERIAL_COLUMNS = "material_id, name, material_type, purpose, date_registered, status"
+    STATEMENTS = {
+        "users_exist": ("SELECT EXISTS (SELECT 1 FROM Users)", None, ()),
+        "user_by_name": ("SELECT user_id FROM Users WHERE username = ?", None, ("admin",)),
+        "shelves": ("SELECT shelf_id, description FROM Shelves", ShelfRow, ()),
+        "shelf_by_description": ("SELECT shelf_id FROM Shelves WHERE description = ?", None, ("A",)),
+        "material_on_shelf": (
+            f"SELECT {MATERIAL_COLUMNS} FROM Materials WHERE material_id = ? AND shelf_id = ?",
+            MaterialRow,
+            (1, 1),
+        ),
+        "material_for_update": (
+            "SELECT name, material_type, purpose, date_registered, status, shelf_id FROM Materials WHERE material_id = ?",
+            None,
+            (1,),
+        ),
+        "material_exists": ("SELECT 1 FROM Materials WHERE material_id = ?", None, (1,)),
+        "deleted_materials_on_shelf": (
+            f"SELECT {MATERIAL_COLUMNS}, date_deleted FROM DeletedMaterials WHERE shelf_id = ?",
+            DeletedMaterialRow,
+            (1,),
+        ),
+        "deleted_material": ("SELECT * FROM DeletedMaterials WHERE material_id = ?", None, (1,)),
+        # Поповнення скану: шукає справну деталь стелажу за каталоговим номером. Лише рядок з цілою кількістю
+        # (як перевіряє isdigit у редакторі), інакше кількість на кшталт "бухта" перезаписав би лічильник сканів
+        "scan_material": (
+            "SELECT material_id FROM Materials WHERE shelf_id = ? AND purpose = ? AND status = ? "
+            "AND material_type GLOB '[0-9]*' AND NOT material_type GLOB '*[^0-9]*' LIMIT 1",
+            None,
+            (1, "C1", "Справний"),
+        ),
+        "material_by_id": (f"SELECT {MATERIAL_COLUMNS} FROM Materials WHERE material_id = ?", MaterialRow, (1,)),
+        # Триграмний індекс
+        "trigram_index_size": (
+            "SELECT (SELECT COUNT(*) FROM MaterialTrigramCounts), (SELECT COUNT(*) FROM Materials)",
+            None,
+            (),
+        ),
+        "materials_to_index": ("SELECT material_id, shelf_id, name, material_type, purpose FROM Materials", None, ()),
+        "material_to_index": ("SELECT shelf_id, name, material_type, purpose FROM Materials WHERE material_id = ?", None, (1,)),
+        # Історія статусів
+        "last_status_change": (
+            "SELECT changed_at FROM StatusHistory WHERE material_id = ? ORDER BY history_id DESC LIMIT 1",
+            None,
+            (1,),
+        ),
+        "material_registered": ("SELECT date_registered FROM Materials WHERE material_id = ?", None, (1,)),
+        "status_durations": (
+            "SELECT bucket, SUM(transitions), SUM(total_seconds) FROM StatusDurations "
+            "WHERE status = ? GROUP BY bucket ORDER BY bucket",
+            None,
+            ("Справний",),
+        ),
+        "status_durations_on_shelf": (
+            "SELECT bucket, SUM(transitions), SUM(total_seconds) FROM StatusDurations "
+            "WHERE status = ? AND shelf_id = ? GROUP BY bucket ORDER BY bucket",
+            None,
+            ("Справний", 1),
+        ),
+        # Звіти по стелажах
+        "shelf_revisions": (
+            "SELECT s.shelf_id, s.description, COALESCE(r.revision, 0) FROM Shelves s "
+            "LEFT JOIN ShelfRevisions r ON r.shelf_id = s.shelf_id",
+            None,
+            (),
+        ),
+        "report_by_status": (
+            "SELECT status, COUNT(*), TOTAL(CAST(material_type AS INTEGER)) FROM Materials "
+            "WHERE shelf_id = ? GROUP BY status ORDER BY status",
+            None,
+            (1,),
+        ),
+        "report_write_off": (
+            "SELECT material_id, name, purpose, material_type, date_registered FROM Materials "
+            "WHERE shelf_id = ? AND status = ? ORDER BY date_registered",
+            None,
+            (1, WRITE_OFF_STATUS),
+        ),
+        "report_aging": (
+            """
+            SELECT CASE
+                WHEN julianday(date_registered) IS NULL THEN 'невідомо'
+                WHEN julianday(?) - julianday(date_registered) < 30 THEN 'до 30 днів'
+                WHEN julianday(?) - julianday(date_registered) < 90 THEN '30-90 днів'
+                WHEN julianday(?) - julianday(date_registered) < 365 THEN '90-365 днів'
+                ELSE 'понад рік'
+            END AS bucket, COUNT(*), TOTAL(CAST(material_type AS INTEGER))
+            FROM Materials WHERE shelf_id = ? GROUP BY bucket ORDER BY MIN(date_registered) DESC
+            """,
+            None,
+            ("2024-01-01", "2024-01-01", "2024-01-01", 1),
+        ),
+        # Найближча дата після звітної, коли позиція переходить у наступний період report_aging
+        "report_next_aging_boundary": (
+            """
+            SELECT MIN(boundary) FROM (
+                SELECT date(date_registered, '+' || days || ' days',
+                            CASE WHEN time(date_registered) = '00:00:00' THEN '+0 days' ELSE '+1 day' END) AS boundary
+                FROM Materials, (SELECT 30 AS days UNION ALL SELECT 90 UNION ALL SELECT 365)
+                WHERE shelf_id = ?
+            ) WHERE boundary > ?
+            """,
+            None,
+            (1, "2024-01-01"),
+        ),
+        # Запис: нові деталі, поповнення сканом і переміщення між стелажами
+        "insert_material": (
+            "INSERT INTO Materials (name, shelf_id, material_type, purpose, date_registered, status) VALUES (?, ?, ?, ?, ?, ?)",
+            None,
+            ("Болт М8", 1, "1", "C1", "2024-01-01 00:00:00", "Справний"),
+        ),
+        "add_quantity": (
+            "UPDATE Materials SET material_type = CAST(material_type AS INTEGER) + ? WHERE material_id = ?",
+            None,
+            (1, 1),
+        ),
+        "transfer_source": (
+            "SELECT name, material_type, purpose, date_registered, status FROM Materials WHERE material_id = ? AND shelf_id = ?",
+            None,
+            (1, 1),
+        ),
+        "transfer_target": (
+            "SELECT material_id FROM Materials WHERE shelf_id = ? AND purpose = ? AND status = ? AND material_id != ? LIMIT 1",
+            None,
+            (2, "C1", "Справний", 1),
+        ),
+        "create_transfer_target": (
+            "INSERT INTO Materials (material_id, name, shelf_id, material_type, purpose, date_registered, status) "
+            "SELECT ?, name, ?, ?, purpose, date_registered, status FROM Materials WHERE material_id = ?",
+            None,
+            (None, 2, 1, 1),
+        ),
+        "restore_transfer_source": (
+            "INSERT INTO Materials (material_id, name, shelf_id, material_type, purpose, date_registered, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            None,
+            (None, "Болт М8", 1, 1, "C1", "2024-01-01 00:00:00", "Справний"),
+        ),
+        "delete_material": ("DELETE FROM Materials WHERE material_id = ?", None, (1,)),
+        "delete_empty_transfer_target": (
+            "DELETE FROM Materials WHERE material_id = ? AND CAST(material_type AS INTEGER) = 0",
+            None,
+            (1,),
+        ),
+        "take_quantity": (
+            "UPDATE Materials SET material_type = CAST(material_type AS INTEGER) - ? "
+            "WHERE material_id = ? AND shelf_id IS ? AND CAST(material_type AS INTEGER) >= ?",
+            None,
+            (1, 1, 1, 1),
+        ),
+        "put_quantity": (
+            "UPDATE Materials SET material_type = CAST(material_type AS INTEGER) + ? WHERE material_id = ? AND shelf_id IS ?",
+            None,
+            (1, 1, 1),
+        ),
+        "relocate_material": ("UPDATE Materials SET shelf_id = ? WHERE material_id = ? AND shelf_id IS ?", None, (2, 1, 1)),
+        "relocate_material_quantity": (
+            "UPDATE Materials SET shelf_id = ? WHERE material_id = ? AND shelf_id IS ? AND CAST(material_type AS INTEGER) = ?",
+            None,
+            (2, 1, 1, 1),
+        ),
+        "log_movement": (
+            "INSERT INTO MovementLedger (moved_at, source_material_id, target_material_id, from_shelf_id, to_shelf_id, quantity) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            None,
+            ("2024-01-01 00:00:00", 1, 2, 1, 2, 1),
+        ),
+    }
+    # Білі списки для динамічних частин запиту до Materials
+    SORT_COLUMNS = {
+        "material_id": "material_id",
+        "name": "name",
+        "quantity": "CAST(material_type AS INTEGER)",
+        "catalog_number": "purpose",
+        "date_registered": "date_registered",
+        "status": "status",
+    }
+    FILTERS = {
+        "shelf_id": "shelf_id = ?",
+        "status": "status = ?",
+        # Умову текстового пошуку будує TrigramIndex.match_clause
+        "text": None,
+    }
+
+    def __init__(self, db, trigram_index):
+        self.db = db
+        self.trigram_index = trigram_index
+
+    @classmethod
+    def statement(cls, name):
+        # Класовий метод: ним користуються й класи без екземпляра реєстру та процеси звітів
+        if name not in cls.STATEMENTS:
+            raise ValueError(f"Unknown query: {name}")
+        return cls.STATEMENTS[name][0]
+
+    def fetch_all(self, name, params=()):
+        return self._fetch_all(self.statement(name), params, self.STATEMENTS[name][1])
+
+    def fetch_one(self, name, params=()):
+        rows = self.fetch_all(name, params)
+        return rows[0] if rows else None
+
+    def _fetch_all(self, query, params, row_type):
+        # Окремий курсор на кожен виклик, щоб запити не ділили спільний self.db.cursor
+        try:
+            rows = self.db.connection.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"An error occurred: {e}")
+            return []
+        return [row_type._make(row) for row in rows] if row_type else rows
+
+    def materials_query(self, filters, order_by=(), limit=None, offset=0):
+        source, source_params = "Materials", ()
+        where, params = [], []
+        rank = None
+        for key, value in filters.items():
+            if key not in self.FILTERS:
+                raise ValueError(f"Unknown filter: {key}")
+            if key == "text":
+                # Пошук за триграмами стелажу: спершу точні збіги підрядка, далі нечіткі з одруківками
+                subquery, source_params = self.trigram_index.match_clause(value, filters.get("shelf_id"))
+                source = (f"({subquery}) AS matches JOIN Materials USING (material_id) "
+                          "LEFT JOIN MaterialTrigramCounts USING (material_id)")
+                rank = "exact DESC, hits DESC, trigram_count"
+            else:
+                where.append(self.FILTERS[key])
+                params.append(value)
+
+        order = []
+        for key, descending in order_by:
+            if key not in self.SORT_COLUMNS:
+                raise ValueError(f"Unknown sort column: {key}")
+            order.append(self.SORT_COLUMNS[key] + (" DESC" if descending else ""))
+        if not order and rank:
+            order.append(rank)
+        if limit is not None:
+            # Однозначний порядок, щоб сторінки не перетиналися
+            order.append("material_id")
+
+        query = f"SELECT {self.MATERIAL_COLUMNS} FROM {source}"
+        params = list(source_params) + params
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        if order:
+            query += " ORDER BY " + ", ".join(order)
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+        return query, tuple(params)
+
+    def materials(self, filters, order_by=(), limit=None, offset=0):
+        query, params = self.materials_query(filters, order_by, limit, offset)
+        return self._fetch_all(query, params, MaterialRow)
+
+    def material_page(self, filters, sort_order, page=0, paged=False, page_size=MATERIAL_PAGE_SIZE):
+        # Сторінка редактора: поки вибірка вміщується в одну сторінку, її сортує інтерфейс,
+        # інакше сортування переходить у SQL, щоб сторінки йшли в заданому порядку.
+        # Повертає (рядки, чи є наступна сторінка, чи сортує SQL)
+        order_by = [(MaterialRow._fields[col_index], descending) for col_index, descending in sort_order] if paged else ()
+        rows = self.materials(filters, order_by, limit=page_size + 1, offset=page * page_size)
+        has_next = len(rows) > page_size
+        if (has_next or page > 0) and sort_order and not paged:
+            return self.material_page(filters, sort_order, page, True, page_size)
+        return rows[:page_size], has_next, has_next or page > 0
+
+    def explain(self, query, params=None):
+        if params is None:
+            params = (None,) * query.count("?")
+        return self.db.connection.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+
+    def benchmark(self, query, params=(), repeat=100):
+        # Запити на запис виконуються у транзакції, яку потім відкочено, тож база не змінюється
+        self.db.connection.commit()
+        try:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                self.db.connection.execute(query, params).fetchall()
+            return (time.perf_counter() - started) / repeat
+        finally:
+            self.db.connection.rollback()
+
+
+class ScanIntake:
+    def __init__(self, db, trigram_index, shelf_id):
+        self.db = db
+        self.trigram_index = trigram_index
+        self.shelf_id = shelf_id
+        self.scans = queue.Queue()
+        # Каталоговий номер -> кількість сканів, ще не записаних у базу
+        self.pending = {}
+
+    def submit(self, code):
+        code = code.strip()
+        if code:
+            self.scans.put(code)
+
+    def drain(self):
+        while True:
+            try:
+                code = self.scans.get_nowait()
+            except queue.Empty:
+                break
+            self.pending[code] = self.pending.get(code, 0) + 1
+
+    def pending_count(self):
+        return sum(self.pending.values())
+
+    def flush(self, batch_size=SCAN_BATCH_SIZE):
+        self.drain()
+        updated = []
+        while self.pending:
+            batch = list(self.pending.items())[:batch_size]
+            try:
+                rows = [self._apply(code, count) for code, count in batch]
+                self.db.connection.commit()
+            except sqlite3.Error as e:
+                self.db.connection.rollback()
+                messagebox.showerror("Database Error", f"An error occurred: {e}")
+                break
+            for code, _ in batch:
+                del self.pending[code]
+            updated.extend(rows)
+        return updated
+
+    def _apply(self, code, count):
+        cursor = self.db.cursor
+        # Скан поповнює лише справні деталі; для решти статусів заводиться новий рядок
+        cursor.execute(QueryRegistry.statement("scan_material"), (self.shelf_id, code, "Справний"))
+        row = cursor.fetchone()
+        if row:
+            material_id = row[0]
+            cursor.execute(QueryRegistry.statement("add_quantity"), (count, material_id))
+            self.trigram_index.index_material(material_id, commit=False)
+        else:
+            cursor.execute(
+                QueryRegistry.statement("insert_material"),
+                (code, self.shelf_id, count, code, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Справний"),
+            )
+            material_id = cursor.lastrowid
+            self.trigram_index.index_material(material_id, commit=False)
+        cursor.execute(QueryRegistry.statement("material_by_id"), (material_id,))
+        return cursor.fetchone()
+
+
+def connect_read_only(db_file):
+    return sqlite3.connect(f"{Path(db_file).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def generate_shelf_report(db_file, shelf_id, description, output_dir, as_of):
+    # Виконується в окремому процесі, тому відкриває власне з'єднання лише для читання
+    connection = connect_read_only(db_file)
+    try:
+        by_status = connection.execute(QueryRegistry.statement("report_by_status"), (shelf_id,)).fetchall()
+        write_off = connection.execute(
+            QueryRegistry.statement("report_write_off"), (shelf_id, WRITE_OFF_STATUS)
+        ).fetchall()
+        aging = connection.execute(
+            QueryRegistry.statement("report_aging"), (as_of, as_of, as_of, shelf_id)
+        ).fetchall()
+        next_boundary = connection.execute(
+            QueryRegistry.statement("report_next_aging_boundary"), (shelf_id, as_of)
+        ).fetchone()[0]
+    finally:
+        connection.close()
+
+    output_dir = Path(output_dir)
+    with open(output_dir / f"shelf_{shelf_id}.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["section", "label", "items", "quantity"])
+        for status, items, quantity in by_status:
+            writer.writerow(["status", status, items, int(quantity)])
+        for material_id, name, catalog_number, quantity, date_registered in write_off:
+            writer.writerow(["write_off", f"{material_id} {name} ({catalog_number}, {date_registered})", 1, quantity])
+        for bucket, items, quantity in aging:
+            writer.writerow(["aging", bucket, items, int(quantity)])
+
+    def table(headers, rows):
+        head = "".join(f"<th>{html.escape(str(h))}</th>" for h in headers)
+        body = "".join("<tr>" + "".join(f"<td>{html.escape(str(v))}</td>" for v in row) + "</tr>" for row in rows)
+        return f"<table border='1'><tr>{head}</tr>{body}</table>"
+
+    with open(output_dir / f"shelf_{shelf_id}.html", "w", encoding="utf-8") as f:
+        f.write(
+            f"<html><head><meta charset='utf-8'><title>{html.escape(str(description))}</title></head><body>"
+            f"<h1>Стелаж: {html.escape(str(description))}</h1><p>Станом на {html.escape(as_of)}</p>"
+            "<h2>Залишки за статусом</h2>"
+            + table(["Статус", "Позицій", "Кількість"], [(st, n, int(q)) for st, n, q in by_status])
+            + f"<h2>{html.escape(WRITE_OFF_STATUS)}</h2>"
+            + table(["ID", "Назва", "Каталоговий номер", "Кількість", "Дата реєстру"], write_off)
+            + "<h2>Термін зберігання</h2>"
+            + table(["Період", "Позицій", "Кількість"], [(b, n, int(q)) for b, n, q in aging])
+            + "</body></html>"
+        )
+    return next_boundary
+
+
+class ReportEngine:
+    def __init__(self, db, output_dir=REPORTS_DIR, max_workers=None):
+        self.db = db
+        self.output_dir = Path(output_dir)
+        self.max_workers = max_workers
+
+    def _load_state(self):
+        try:
+            with open(self.output_dir / REPORT_STATE_FILE, encoding="utf-8") as f:
+                return {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        with open(self.output_dir / REPORT_STATE_FILE, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    def generate(self, force=False):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        shelves = self.db.fetch_all(QueryRegistry.statement("shelf_revisions"))
+        # Стан стелажу — [ревізія, найближча межа періоду зберігання]: незмінений стелаж
+        # перегенеровується лише в день, коли якась позиція переходить у наступний період
+        as_of = datetime.date.today().isoformat()
+        previous = self._load_state()
+        state = {}
+        changed = []
+        for shelf_id, description, revision in shelves:
+            saved = previous.get(shelf_id)
+            if (
+                force or saved is None or saved[0] != revision
+                or (saved[1] is not None and saved[1] <= as_of)
+                or not (self.output_dir / f"shelf_{shelf_id}.html").exists()
+            ):
+                changed.append((shelf_id, description, revision))
+            else:
+                state[shelf_id] = saved
+
+        if changed:
+            # multiprocessing імпортується лише для нічних звітів, а не під час кожного запуску інтерфейсу
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [
+                    (shelf_id, revision, pool.submit(
+                        generate_shelf_report, self.db.db_file, shelf_id, description, str(self.output_dir), as_of
+                    ))
+                    for shelf_id, description, revision in changed
+                ]
+                for shelf_id, revision, future in futures:
+                    state[shelf_id] = [revision, future.result()]
+
+        with open(self.output_dir / "index.html", "w", encoding="utf-8") as f:
+            links = "".join(
+                f"<li><a href='shelf_{shelf_id}.html'>{html.escape(str(description))}</a> "
+                f"(<a href='shelf_{shelf_id}.csv'>CSV</a>)</li>"
+                for shelf_id, description, _ in shelves
+            )
+            f.write(f"<html><head><meta charset='utf-8'><title>Звіти</title></head><body><ul>{links}</ul></body></html>")
+
+        self._save_state(state)
+        return [shelf_id for shelf_id, _, _ in changed]
+
+
+class StatusHistory:
+    # Тривалості зберігаються лог-лінійною гістограмою (див. duration_bucket),
+    # тому середнє та перцентилі рахуються без перегляду всієї історії
+    def __init__(self, db):
+        self.db = db
+
+    def record_transition(self, material_id, shelf_id, old_status, new_status, commit=True):
+        now = datetime.datetime.now()
+        cursor = self.db.cursor
+        # Позначки часу мають секундну точність, тому останній перехід визначається за history_id
+        cursor.execute(QueryRegistry.statement("last_status_change"), (material_id,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(QueryRegistry.statement("material_registered"), (material_id,))
+            row = cursor.fetchone()
+        if old_status:
+            self._add_duration(shelf_id, old_status, row and row[0], now)
+        cursor.execute(
+            "INSERT INTO StatusHistory (material_id, shelf_id, old_status, new_status, changed_at) VALUES (?, ?, ?, ?, ?)",
+            (material_id, shelf_id, old_status, new_status, now.strftime("%Y-%m-%d %H:%M:%S")),
+        )
+        if commit:
+            self.db.connection.commit()
+
+    def _add_duration(self, shelf_id, status, entered_at, left_at):
+        try:
+            entered_at = datetime.datetime.strptime(entered_at, "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            return
+        seconds = max(0.0, (left_at - entered_at).total_seconds())
+        self.db.cursor.execute(
+            """
+            INSERT INTO StatusDurations (shelf_id, status, bucket, transitions, total_seconds) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (shelf_id, status, bucket) DO UPDATE
+            SET transitions = transitions + 1, total_seconds = total_seconds + excluded.total_seconds
+            """,
+            (shelf_id, status, duration_bucket(seconds), seconds),
+        )
+
+    def time_in_status(self, status, shelf_id=None, percentiles=(50, 90)):
+        if shelf_id is None:
+            buckets = self.db.fetch_all(QueryRegistry.statement("status_durations"), (status,))
+        else:
+            buckets = self.db.fetch_all(QueryRegistry.statement("status_durations_on_shelf"), (status, shelf_id))
+        count = sum(transitions for _, transitions, _ in buckets)
+        result = {"count": count, "average": None}
+        result.update({f"p{p}": None for p in percentiles})
+        if not count:
+            return result
+        result["average"] = sum(total for _, _, total in buckets) / count
+        for p in percentiles:
+            rank = p * count / 100
+            seen = 0
+            for bucket, transitions, _ in buckets:
+                if seen + transitions >= rank:
+                    # Лінійна інтерполяція за рангом усередині кошика
+                    low, high = duration_bucket_bounds(bucket)
+                    result[f"p{p}"] = low + (high - low) * (rank - seen) / transitions
+                    break
+                seen += transitions
+        return result
+
+
+class ConsistencyChecker:
+    # (назва перевірки, таблиця, умова проблемного рядка)
+    CHECKS = (
+        ("orphan_material", "Materials", "shelf_id IS NOT NULL AND shelf_id NOT IN (SELECT shelf_id FROM Shelves)"),
+        ("orphan_deleted_material", "DeletedMaterials", "shelf_id IS NOT NULL AND shelf_id NOT IN (SELECT shelf_id FROM Shelves)"),
+        ("duplicate_deleted_material", "DeletedMaterials", "material_id IN (SELECT material_id FROM Materials)"),
+        ("invalid_status", "Materials", "status IS NULL OR status NOT IN ({statuses})"),
+        ("invalid_deleted_status", "DeletedMaterials", "status IS NULL OR status NOT IN ({statuses})"),
+        ("orphan_trigrams", "MaterialTrigramCounts", "material_id NOT IN (SELECT material_id FROM Materials)"),
+    )
+    REPAIR_STATUS = "Очікує діагностики"
+
+    def __init__(self, db, trigram_index, status_history, chunk_size=CONSISTENCY_CHUNK_SIZE):
+        self.db = db
+        self.trigram_index = trigram_index
+        self.status_history = status_history
+        self.chunk_size = chunk_size
+
+    def _checkpoint(self, check_name):
+        row = self.db.fetch_one("SELECT last_rowid FROM ConsistencyCheckpoints WHERE check_name = ?", (check_name,))
+        return row[0] if row else 0
+
+    def _save_checkpoint(self, check_name, last_rowid):
+        self.db.execute_query(
+            "INSERT OR REPLACE INTO ConsistencyCheckpoints (check_name, last_rowid) VALUES (?, ?)",
+            (check_name, last_rowid),
+        )
+
+    def _condition(self, condition):
+        params = tuple(STATUS_VALUES) if "{statuses}" in condition else ()
+        return condition.format(statuses=", ".join("?" * len(STATUS_VALUES))), params
+
+    def run(self, max_chunks=None):
+        # Повертає (усі проблеми проходу, чи завершено повний прохід). Перерваний прохід продовжується
+        # з контрольної точки, а знахідки зберігаються разом з нею, тож не губляться після перезапуску
+        chunks = 0
+        for check_name, table, condition in self.CHECKS:
+            condition, params = self._condition(condition)
+            while True:
+                start = self._checkpoint(check_name)
+                if start < 0:
+                    break
+                if max_chunks is not None and chunks >= max_chunks:
+                    return [], False
+                end = self.db.fetch_one(
+                    f"SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                    (start, self.chunk_size),
+                )[0]
+                if end is None:
+                    self._save_checkpoint(check_name, -1)
+                    break
+                rows = self.db.fetch_all(
+                    f"SELECT rowid FROM {table} WHERE rowid > ? AND rowid <= ? AND ({condition})",
+                    (start, end) + params,
+                )
+                # Знахідки порції і контрольна точка фіксуються однією транзакцією
+                self.db.cursor.executemany(
+                    "INSERT OR IGNORE INTO ConsistencyFindings (check_name, table_name, row_id) VALUES (?, ?, ?)",
+                    [(check_name, table, rowid) for (rowid,) in rows],
+                )
+                self._save_checkpoint(check_name, end)
+                chunks += 1
+        issues = self.db.fetch_all("SELECT check_name, table_name, row_id FROM ConsistencyFindings ORDER BY check_name, row_id")
+        self.db.cursor.execute("DELETE FROM ConsistencyFindings")
+        self.db.execute_query("DELETE FROM ConsistencyCheckpoints WHERE last_rowid < 0 AND check_name != 'foreign_keys'")
+        return issues, True
+
+    def repair(self, issues):
+        # Між перевіркою і виправленням дані могли змінитися, тому кожна зміна повторно перевіряє умову
+        conditions = {check_name: self._condition(condition) for check_name, _, condition in self.CHECKS}
+        cursor = self.db.cursor
+        for check_name, table, rowid in issues:
+            condition, params = conditions[check_name]
+            if check_name in ("orphan_material", "orphan_trigrams"):
+                cursor.execute(f"DELETE FROM {table} WHERE rowid = ? AND ({condition})", (rowid,) + params)
+                if cursor.rowcount:
+                    cursor.execute("DELETE FROM MaterialTrigrams WHERE material_id = ?", (rowid,))
+                    cursor.execute("DELETE FROM MaterialTrigramCounts WHERE material_id = ?", (rowid,))
+            elif check_name in ("orphan_deleted_material", "duplicate_deleted_material"):
+                # Ідентифікатори Materials не повторюються, тож дублікат — застаріла копія вже відновленої деталі
+                cursor.execute(f"DELETE FROM {table} WHERE rowid = ? AND ({condition})", (rowid,) + params)
+            elif check_name in ("invalid_status", "invalid_deleted_status"):
+                cursor.execute(
+                    f"SELECT shelf_id, status FROM {table} WHERE rowid = ? AND ({condition})", (rowid,) + params
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    continue
+                cursor.execute(f"UPDATE {table} SET status = ? WHERE rowid = ?", (self.REPAIR_STATUS, rowid))
+                self.status_history.record_transition(rowid, row[0], row[1], self.REPAIR_STATUS, commit=False)
+        self.db.connection.commit()
+
+    def enable_foreign_keys(self, recheck=False):
+        # Вмикаємо перевірку зовнішніх ключів лише якщо наявні дані її не порушують. Повний
+        # foreign_key_check довгий, тому невдалий результат запам'ятовується (-1) і під час запуску
+        # не повторюється, доки перевірка цілісності не попросить перевірити знову (recheck=True)
+        passed = self._checkpoint("foreign_keys")
+        if passed < 0 and not recheck:
+            return False
+        if passed != 1:
+            if self.db.fetch_one("PRAGMA foreign_key_check"):
+                self._save_checkpoint("foreign_keys", -1)
+                return False
+            self._save_checkpoint("foreign_keys", 1)
+        self.db.connection.commit()
+        self.db.cursor.execute("PRAGMA foreign_keys = ON")
+        return True
+
+
+class OperationJournal:
+    # Групи операцій редактора у вигляді кортежів, які можна застосувати в обидва боки:
+    #   ("delete", material_id)
+    #   ("move", material_id, old_shelf_id, new_shelf_id)
+    #   ("transfer", material_id, from_shelf_id, to_shelf_id, quantity) — переміщення частини кількості;
+    #       після виконання доповнюється (target_id, target_created, source_values), щоб його можна було скасувати,
+    #       а при повторі виконується заново з повною перевіркою
+    #   ("update", material_id, shelf_id, changes), changes — ((стовпець, старе значення, нове значення), ...)
+    #       лише для змінених стовпців з UPDATE_COLUMNS
+    UPDATE_COLUMNS = ("name", "material_type", "purpose", "date_registered", "status")
+
+    def __init__(self, db, trigram_index, status_history, limit=JOURNAL_LIMIT):
+        self.db = db
+        self.trigram_index = trigram_index
+        self.status_history = status_history
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = deque(maxlen=limit)
+
+    def execute(self, group):
+        group = self._run(group, undo=False) if group else None
+        if group is None:
+            return set()
+        self.undo_stack.append(group)
+        self.redo_stack.clear()
+        return self._affected(group)
+
+    def undo(self):
+        if not self.undo_stack:
+            return set()
+        group = self.undo_stack.pop()
+        if self._run(group, undo=True) is None:
+            self.undo_stack.append(group)
+            return set()
+        self.redo_stack.append(group)
+        return self._affected(group)
+
+    def redo(self):
+        if not self.redo_stack:
+            return set()
+        group = self.redo_stack.pop()
+        resolved = self._run(group, undo=False)
+        if resolved is None:
+            self.redo_stack.append(group)
+            return set()
+        self.undo_stack.append(resolved)
+        return self._affected(resolved)
+
+    def _affected(self, group):
+        affected = set()
+        for op in group:
+            affected.add(op[1])
+            if op[0] == "transfer":
+                affected.add(op[5])
+        return affected
+
+    def _run(self, group, undo):
+        # Уся група застосовується однією транзакцією; повертає групу з доповненими операціями
+        try:
+            if undo:
+                resolved = [self._apply(op, undo) for op in reversed(group)][::-1]
+            else:
+                resolved = [self._apply(op, undo) for op in group]
+            self.db.connection.commit()
+        except (sqlite3.Error, ValueError) as e:
+            self.db.connection.rollback()
+            messagebox.showerror("Database Error", f"An error occurred: {e}")
+            return None
+        return tuple(resolved)
+
+    def _apply(self, op, undo):
+        cursor = self.db.cursor
+        kind, material_id = op[0], op[1]
+        if kind == "delete":
+            if undo:
+                cursor.execute(
+                    "INSERT INTO Materials (material_id, name, shelf_id, material_type, purpose, date_registered, status) "
+                    "SELECT material_id, name, shelf_id, material_type, purpose, date_registered, status "
+                    "FROM DeletedMaterials WHERE material_id = ?",
+                    (material_id,),
+                )
+                cursor.execute("DELETE FROM DeletedMaterials WHERE material_id = ?", (material_id,))
+                self.trigram_index.index_material(material_id, commit=False)
+            else:
+                cursor.execute(
+                    "INSERT INTO DeletedMaterials (material_id, name, shelf_id, material_type, purpose, date_registered, status, date_deleted) "
+                    "SELECT material_id, name, shelf_id, material_type, purpose, date_registered, status, ? "
+                    "FROM Materials WHERE material_id = ?",
+                    (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), material_id),
+                )
+                cursor.execute("DELETE FROM Materials WHERE material_id = ?", (material_id,))
+                self.trigram_index.remove_material(material_id, commit=False)
+        elif kind == "move":
+            from_shelf_id, to_shelf_id = (op[3], op[2]) if undo else (op[2], op[3])
+            self._relocate(material_id, from_shelf_id, to_shelf_id)
+            cursor.execute("SELECT material_type FROM Materials WHERE material_id = ?", (material_id,))
+            self._log_movement(material_id, material_id, from_shelf_id, to_shelf_id, cursor.fetchone()[0])
+        elif kind == "update":
+            shelf_id, changes = op[2], op[3]
+            columns = [column for column, _, _ in changes]
+            if any(column not in self.UPDATE_COLUMNS for column in columns):
+                raise ValueError(f"Unknown column in update: {columns}")
+            before = {column: new if undo else old for column, old, new in changes}
+            after = {column: old if undo else new for column, old, new in changes}
+            # Змінюються лише відредаговані стовпці і лише якщо рядок досі має значення, від яких рахувалася зміна,
+            # щоб не затерти пізніші правки (наприклад, кількість, додану сканером)
+            cursor.execute(
+                f"UPDATE Materials SET {', '.join(f'{column} = ?' for column in columns)} "
+                f"WHERE material_id = ? AND {' AND '.join(f'{column} IS ?' for column in columns)}",
+                tuple(after[column] for column in columns) + (material_id,) + tuple(before[column] for column in columns),
+            )
+            if cursor.rowcount != 1:
+                raise ValueError(f"Деталь із ID {material_id} змінилася після редагування.")
+            if after.keys() & {"name", "material_type", "purpose"}:
+                self.trigram_index.index_material(material_id, commit=False)
+            if "status" in after:
+                self.status_history.record_transition(material_id, shelf_id, before["status"], after["status"], commit=False)
+        elif kind == "transfer":
+            return self._transfer(op, undo)
+        return op
+
+    def _transfer(self, op, undo):
+        cursor = self.db.cursor
+        source_id, from_shelf_id, to_shelf_id, quantity = op[1:5]
+        if not undo:
+            cursor.execute(QueryRegistry.statement("transfer_source"), (source_id, from_shelf_id))
+            source = cursor.fetchone()
+            if source is None:
+                raise ValueError(f"Деталь із ID {source_id} не знайдено на стелажі.")
+            available = int(source[1])
+            if not 0 < quantity <= available:
+                raise ValueError(f"Некоректна кількість для переміщення: {quantity} з {available}.")
+            # Цільовий рядок шукаємо за індексом (shelf_id, purpose); зливаються лише деталі з тим самим статусом
+            cursor.execute(QueryRegistry.statement("transfer_target"), (to_shelf_id, source[2], source[4], source_id))
+            target = cursor.fetchone()
+            whole = quantity == available
+            if target:
+                target_id, target_created = target[0], False
+            elif whole:
+                target_id, target_created = source_id, False
+            else:
+                target_id, target_created = None, True
+            source_values = tuple(source) if whole and target else None
+        else:
+            target_id, target_created, source_values = op[5:8]
+
+        if undo:
+            # Після переміщення з цільовим рядком могли працювати, тож скасування перевіряє, що кількість ще на місці
+            if target_id == source_id:
+                self._relocate(source_id, to_shelf_id, from_shelf_id, quantity)
+            else:
+                self._take(target_id, to_shelf_id, quantity)
+                if target_created:
+                    cursor.execute(QueryRegistry.statement("delete_empty_transfer_target"), (target_id,))
+                    if cursor.rowcount:
+                        self.trigram_index.remove_material(target_id, commit=False)
+                if source_values is not None:
+                    cursor.execute(
+                        QueryRegistry.statement("restore_transfer_source"),
+                        (source_id, source_values[0], from_shelf_id, quantity) + tuple(source_values[2:]),
+                    )
+                    self.trigram_index.index_material(source_id, commit=False)
+                else:
+                    self._put(source_id, from_shelf_id, quantity)
+            self._log_movement(target_id, source_id, to_shelf_id, from_shelf_id, quantity)
+            return op
+
+        if target_id == source_id:
+            self._relocate(source_id, from_shelf_id, to_shelf_id)
+        else:
+            if target_created:
+                cursor.execute(
+                    QueryRegistry.statement("create_transfer_target"), (target_id, to_shelf_id, quantity, source_id)
+                )
+                target_id = cursor.lastrowid
+                self.trigram_index.index_material(target_id, commit=False)
+            else:
+                self._put(target_id, to_shelf_id, quantity)
+            if source_values is not None:
+                cursor.execute(QueryRegistry.statement("delete_material"), (source_id,))
+                self.trigram_index.remove_material(source_id, commit=False)
+            else:
+                self._take(source_id, from_shelf_id, quantity)
+        self._log_movement(source_id, target_id, from_shelf_id, to_shelf_id, quantity)
+        return ("transfer", source_id, from_shelf_id, to_shelf_id, quantity, target_id, target_created, source_values)
+
+    # Кожна зміна рядка перевіряє, що він ще на очікуваному стелажі; інакше ValueError відкочує всю групу
+    def _take(self, material_id, shelf_id, quantity):
+        self.db.cursor.execute(QueryRegistry.statement("take_quantity"), (quantity, material_id, shelf_id, quantity))
+        if self.db.cursor.rowcount != 1:
+            raise ValueError(f"На стелажі вже немає {quantity} од. деталі з ID {material_id}.")
+        self.trigram_index.index_material(material_id, commit=False)
+
+    def _put(self, material_id, shelf_id, quantity):
+        self.db.cursor.execute(QueryRegistry.statement("put_quantity"), (quantity, material_id, shelf_id))
+        if self.db.cursor.rowcount != 1:
+            raise ValueError(f"Деталь із ID {material_id} не знайдено на стелажі.")
+        self.trigram_index.index_material(material_id, commit=False)
+
+    def _relocate(self, material_id, from_shelf_id, to_shelf_id, quantity=None):
+        # Якщо задано quantity, рядок переноситься лише з рівно такою кількістю, щоб не забрати пізніші надходження
+        if quantity is None:
+            self.db.cursor.execute(QueryRegistry.statement("relocate_material"), (to_shelf_id, material_id, from_shelf_id))
+        else:
+            self.db.cursor.execute(
+                QueryRegistry.statement("relocate_material_quantity"), (to_shelf_id, material_id, from_shelf_id, quantity)
+            )
+        if self.db.cursor.rowcount != 1:
+            raise ValueError(f"Деталь із ID {material_id} не знайдено на стелажі.")
+
+    def _log_movement(self, source_id, target_id, from_shelf_id, to_shelf_id, quantity):
+        self.db.cursor.execute(
+            QueryRegistry.statement("log_movement"),
+            (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), source_id, target_id, from_shelf_id, to_shelf_id, quantity),
+        )
+
+
 class User:
     def __init__(self, db, username, password):
         self.db = db
         self.username = username
         self.password = password
         self.role = None
+        self.session_token = None
+        self.session_expires = 0.0
 
     def login(self):
-        query = "SELECT role FROM Users WHERE username = ? AND password = ?"
-        result = self.db.fetch_all(query, (self.username, self.password))
-        if result:
-            self.role = result[0][0]
-            return True
-        return False
+        result = self.db.fetch_one("SELECT user_id, password, role FROM Users WHERE username = ?", (self.username,))
+        if not result:
+            verify_password(self.password, DUMMY_PASSWORD_HASH)
+            return False
+        user_id, stored, role = result
+        ok, needs_upgrade = verify_password(self.password, stored)
+        if not ok:
+            return False
+        # Старі паролі у відкритому вигляді та хеші зі слабшими параметрами перехешовуються при вході
+        if needs_upgrade:
+            self.db.execute_query("UPDATE Users SET password = ? WHERE user_id = ?", (hash_password(self.password), user_id))
+        self.password = None
+        self.start_session(role)
+        return True
 
     def register(self, role):
         query = "INSERT INTO Users (username, password, role) VALUES (?, ?, ?)"
         try:
-            self.db.execute_query(query, (self.username, self.password, role))
+            self.db.execute_query(query, (self.username, hash_password(self.password), role))
             return True
         except sqlite3.IntegrityError:
             return False
 
+    def start_session(self, role):
+        # Після входу ролі перевіряються лише за токеном сесії, без KDF і запитів до Users
+        self.role = role
+        self.session_token = secrets.token_urlsafe(32)
+        self.session_expires = time.monotonic() + SESSION_LIFETIME_SECONDS
+
+    def session_active(self):
+        return self.session_token is not None and time.monotonic() < self.session_expires
+
+    def has_role(self, *roles):
+        return self.session_active() and self.role in roles
+
     def is_admin(self):
-        return self.role == "admin"
+        return self.has_role("admin")
 
     def is_worker(self):
-        return self.role == "worker"
+        return self.has_role("worker")
 
     def is_guest(self):
-        return self.role == "guest"
+        return self.has_role("guest")
 
 class WarehouseApp:
     def __init__(self, root, db):
         self.root = root
         self.db = db
         self.db_setup = DatabaseSetup(self.db)
+        self.trigram_index = TrigramIndex(self.db)
+        if self.db_setup.upgraded:
+            self.trigram_index.ensure_built()
+        self.status_history = StatusHistory(self.db)
+        self.queries = QueryRegistry(self.db, self.trigram_index)
+        self.consistency_checker = ConsistencyChecker(self.db, self.trigram_index, self.status_history)
+        self.consistency_checker.enable_foreign_keys()
+        # Екрани будуються один раз і далі лише показуються з оновленими даними
+        self.screens = {}
+        self.shelf_editors = {}
+        self.users_exist = False
         self.show_login_screen()
 
-    def show_login_screen(self):
+    def show_screen(self, key, build, **pack_options):
         self.clear_window()
-        login_window = tk.Frame(self.root)
-        login_window.pack(pady=40)
+        if key not in self.screens:
+            self.screens[key] = build()
+        self.screens[key].pack(**pack_options)
+        return self.screens[key]
+
+    def show_login_screen(self):
+        # Вихід з акаунту завершує сесію, тож редактори стелажів разом з журналами дій закриваються
+        for editor_window, _ in self.shelf_editors.values():
+            editor_window.destroy()
+        self.shelf_editors.clear()
 
-        # Перевірка наявності користувачів у базі
-        users_exist = self.db.fetch_one("SELECT COUNT(*) FROM Users")[0] > 0
+        # Користувачів програма не видаляє, тож після першої знайденої перевірку не повторюємо
+        if not self.users_exist:
+            self.users_exist = self.queries.fetch_one("users_exist")[0] == 1
 
-        if not users_exist:
+        self.show_screen(("login", self.users_exist), self.build_login_screen, pady=40)
+        if self.users_exist:
+            self.login_username_entry.delete(0, tk.END)
+            self.login_password_entry.delete(0, tk.END)
+
+        self.root.geometry("900x800")
+
+    def build_login_screen(self):
+        login_window = tk.Frame(self.root)
+
+        if not self.users_exist:
             tk.Label(login_window, text="Реєстрація першого адміністратора", font=("Arial", 18, "bold"), fg="red").pack(pady=20)
             tk.Button(login_window, text="Зареєструвати адміністратора", font=("Arial", 18), command=self.show_first_admin_registration, width=30, height=2, ).pack(pady=20)
         else:
@@ -157,7 +1439,7 @@ class WarehouseApp:
             tk.Button(button_frame, text="Вхід у режимі гостя", font=("Arial", 18), 
                     command=lambda: self.guest_login(), width=22, height=2).grid(row=1, column=0, padx=20, pady=10)
 
-        self.root.geometry("900x800")
+        return login_window
 
     def show_first_admin_registration(self):
         self.clear_window()
@@ -189,10 +1471,7 @@ class WarehouseApp:
                 return
 
             try:
-                self.db.execute_query(
-                    "INSERT INTO Users (username, password, role) VALUES (?, ?, ?)",
-                    (username, password, "admin"),
-                )
+                User(self.db, username, password).register("admin")
                 messagebox.showinfo("Успішна реєстрація", "Адміністратор успішно зареєстрований!")
                 self.show_login_screen()  # Повертаємось на екран входу після реєстрації
             except Exception as e:
@@ -261,7 +1540,7 @@ class WarehouseApp:
 
     def guest_login(self):
         self.user = User(self.db, "Гість", None)
-        self.user.role = "guest"
+        self.user.start_session("guest")
         messagebox.showinfo("Режим гостя", "Ви ввійшли в програму як гість. Доступ лише для перегляду.")
         self.show_main_menu()
 
@@ -296,7 +1575,7 @@ class WarehouseApp:
             messagebox.showerror("Реєстрація не вдалася", "Пароль повинен містити мінімум 8 символів.")
             return
 
-        existing_user = self.db.fetch_one("SELECT * FROM Users WHERE username = ?", (username,))
+        existing_user = self.queries.fetch_one("user_by_name", (username,))
         if existing_user:
             messagebox.showerror("Реєстрація не вдалася", "Ім'я користувача вже існує.")
             return
@@ -310,10 +1589,25 @@ class WarehouseApp:
 
 
     def show_main_menu(self):
-        self.clear_window()
+        self.show_screen("main_menu", self.build_main_menu, fill=tk.BOTH, expand=True)
+
+        role_state = tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED
+        for button in self.shelf_buttons:
+            button.config(state=role_state)
+        for button in self.admin_buttons:
+            if self.user.is_admin():
+                button.grid()
+            else:
+                button.grid_remove()
+
+        self.selected_shelf_id = None
+        self.selected_shelf.set("Оберіть стелаж")
+        self.update_shelf_list()
 
+        self.root.state('zoomed') 
+
+    def build_main_menu(self):
         main_frame = tk.Frame(self.root, padx=50, pady=50)
-        main_frame.pack(fill=tk.BOTH, expand=True)
 
         main_frame.grid_columnconfigure(0, weight=1, minsize=400)
         main_frame.grid_columnconfigure(1, weight=1, minsize=400)
@@ -322,7 +1616,6 @@ class WarehouseApp:
         shelf_frame.grid(row=1, column=0, columnspan=2, pady=20)
 
         tk.Label(shelf_frame, text="Оберіть стелаж:", font=("Arial", 24)).grid(row=0, column=0, sticky="e", padx=20)
-        self.selected_shelf_id = None
         self.selected_shelf = tk.StringVar(value="Оберіть стелаж")
         self.shelf_dropdown = ttk.Combobox(
             shelf_frame,
@@ -332,7 +1625,6 @@ class WarehouseApp:
             width=40  
         )
         self.shelf_dropdown.grid(row=0, column=1, sticky="w", padx=20)
-        self.update_shelf_list()
         self.shelf_dropdown.bind("<<ComboboxSelected>>", self.set_selected_shelf)
 
         self.shelf_dropdown.option_add("*TCombobox*Listbox.font", ("Arial", 16))  
@@ -352,32 +1644,35 @@ class WarehouseApp:
             command=lambda: self.open_shelf_editor(self.selected_shelf_id),
         ).grid(row=0, column=0, padx=30, pady=15)
 
-        tk.Button(
+        add_shelf_button = tk.Button(
             button_frame,
             text="Додати стелаж",
             font=button_font,
             width=button_width,
             command=self.add_shelf,
-            state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED,
-        ).grid(row=1, column=0, padx=30, pady=15)
+        )
+        add_shelf_button.grid(row=1, column=0, padx=30, pady=15)
 
-        tk.Button(
+        delete_shelf_button = tk.Button(
             button_frame,
             text="Видалити стелаж",
             font=button_font,
             width=button_width,
             command=self.delete_shelf,
-            state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED,
-        ).grid(row=2, column=0, padx=30, pady=15)
-
-        if self.user.role == "admin":
-            tk.Button(
-                button_frame,
-                text="Зареєструвати працівника",
-                font=button_font,
-                width=button_width,
-                command=self.show_registration_screen,
-            ).grid(row=3, column=0, padx=30, pady=15)
+        )
+        delete_shelf_button.grid(row=2, column=0, padx=30, pady=15)
+        self.shelf_buttons = [add_shelf_button, delete_shelf_button]
+
+        # Кнопки адміністратора показуються або ховаються в show_main_menu залежно від ролі
+        self.admin_buttons = []
+        for row, text, command in (
+            (3, "Зареєструвати працівника", self.show_registration_screen),
+            (5, "Звіти по стелажах", self.generate_reports),
+            (6, "Перевірка цілісності", self.check_consistency),
+        ):
+            button = tk.Button(button_frame, text=text, font=button_font, width=button_width, command=command)
+            button.grid(row=row, column=0, padx=30, pady=15)
+            self.admin_buttons.append(button)
 
         tk.Button(
             button_frame,
@@ -387,10 +1682,38 @@ class WarehouseApp:
             command=self.show_login_screen,
         ).grid(row=4, column=0, padx=30, pady=15)
 
-        self.root.state('zoomed') 
+        return main_frame
 
 
+    def generate_reports(self):
+        try:
+            regenerated = ReportEngine(self.db).generate()
+        except Exception as e:
+            messagebox.showerror("Помилка", f"Не вдалося сформувати звіти: {e}")
+            return
+        messagebox.showinfo("Звіти", f"Оновлено звітів: {len(regenerated)}. Каталог: {os.path.abspath(REPORTS_DIR)}")
+
+    def check_consistency(self):
+        # Перевірка йде порціями через after(), щоб не блокувати інтерфейс на великій базі
+        def step():
+            issues, done = self.consistency_checker.run(max_chunks=1)
+            if not done:
+                self.root.after(1, step)
+                return
+            if not issues:
+                self.consistency_checker.enable_foreign_keys(recheck=True)
+                messagebox.showinfo("Перевірка цілісності", "Проблем не знайдено.")
+                return
+            counts = {}
+            for check_name, _, _ in issues:
+                counts[check_name] = counts.get(check_name, 0) + 1
+            report = "\n".join(f"{name}: {count}" for name, count in counts.items())
+            if messagebox.askyesno("Перевірка цілісності", f"Знайдено проблеми:\n{report}\n\nВиправити?"):
+                self.consistency_checker.repair(issues)
+                self.consistency_checker.enable_foreign_keys(recheck=True)
+                messagebox.showinfo("Перевірка цілісності", "Проблеми виправлено.")
 
+        step()
 
     def add_shelf(self):
         if not (self.user.is_admin()):
@@ -445,8 +1768,12 @@ class WarehouseApp:
 
         confirm = messagebox.askyesno("Підтвердження видалення", "Ви впевнені, що хочете видалити цей стелаж та всі дані на ньому?")
         if confirm:
+            self.trigram_index.remove_shelf(self.selected_shelf_id)
             self.db.execute_query("DELETE FROM Materials WHERE shelf_id = ?", (self.selected_shelf_id,))
+            self.db.execute_query("DELETE FROM DeletedMaterials WHERE shelf_id = ?", (self.selected_shelf_id,))
             self.db.execute_query("DELETE FROM Shelves WHERE shelf_id = ?", (self.selected_shelf_id,))
+            if self.selected_shelf_id in self.shelf_editors:
+                self.shelf_editors.pop(self.selected_shelf_id)[0].destroy()
             self.update_shelf_list()
             self.selected_shelf_id = None
             messagebox.showinfo("Успіх", "Стелаж та його дані видалено успішно.")
@@ -454,23 +1781,31 @@ class WarehouseApp:
             
 
     def update_shelf_list(self):
-        shelves = self.db.fetch_all("SELECT shelf_id, description FROM Shelves")
+        shelves = self.queries.fetch_all("shelves")
         self.shelf_options = [shelf[1] for shelf in shelves]
         self.shelf_dropdown['values'] = self.shelf_options
 
 
     def set_selected_shelf(self, event):
         shelf_name = self.selected_shelf.get()
-        result = self.db.fetch_one("SELECT shelf_id FROM Shelves WHERE description = ?", (shelf_name,))
+        result = self.queries.fetch_one("shelf_by_description", (shelf_name,))
         self.selected_shelf_id = result[0] if result else None
         
 
         
     def open_shelf_editor(self, shelf_id):
+        if shelf_id in self.shelf_editors:
+            editor_window, refresh = self.shelf_editors[shelf_id]
+            editor_window.deiconify()
+            editor_window.lift()
+            refresh()
+            return
+
         editor_window = tk.Toplevel(self.root)
         editor_window.title(f"Shelf Editor - Shelf {shelf_id}")
         editor_window.geometry("1920x1020")  
         editor_window.state("zoomed") 
+        journal = OperationJournal(self.db, self.trigram_index, self.status_history)
 
         top_frame = tk.Frame(editor_window)
         top_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -480,8 +1815,8 @@ class WarehouseApp:
 
         columns = ("ID", "Назва", "Кількість", "Каталоговий номер", "Дата реєстру", "Статус")
         treeview = ttk.Treeview(table_frame, columns=columns, show="headings", height=20)
-        for col in columns:
-            treeview.heading(col, text=col)
+        for col_index, col in enumerate(columns):
+            treeview.heading(col, text=col, command=lambda col_index=col_index: on_heading_click(col_index))
             treeview.column(col, width=150, anchor="center")
         treeview.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
@@ -489,6 +1824,15 @@ class WarehouseApp:
         treeview.configure(yscrollcommand=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+        page_frame = tk.Frame(editor_window)
+        page_frame.pack(fill=tk.X, padx=10)
+        prev_page_button = tk.Button(page_frame, text="< Попередня сторінка", font=("Arial", 12), command=lambda: change_page(-1))
+        prev_page_button.pack(side=tk.LEFT, padx=10)
+        page_label = tk.Label(page_frame, text="", font=("Arial", 12))
+        page_label.pack(side=tk.LEFT, padx=10)
+        next_page_button = tk.Button(page_frame, text="Наступна сторінка >", font=("Arial", 12), command=lambda: change_page(1))
+        next_page_button.pack(side=tk.LEFT, padx=10)
+
         view_buttons_frame = tk.Frame(top_frame)
         view_buttons_frame.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
 
@@ -529,57 +1873,96 @@ class WarehouseApp:
 
         
 
-        def apply_sort():
-            sort_by = sort_combobox.get()
+        # Ключі сортування: [(індекс колонки, за спаданням)], перший — головний
+        sort_order = []
+        row_keys = {}
+        search_filter = {"filters": {"shelf_id": shelf_id}, "paged": False, "page": 0}
+
+        def update_heading_labels():
+            arrows = {col_index: " ▼" if descending else " ▲" for col_index, descending in sort_order}
+            for col_index, col in enumerate(columns):
+                treeview.heading(col, text=col + arrows.get(col_index, ""))
+
+        def sort_loaded_rows():
+            items = treeview.get_children()
+            for item in items:
+                if item not in row_keys:
+                    row_keys[item] = material_sort_keys(treeview.item(item, "values"))
+            for index, item in enumerate(sort_by_keys(items, row_keys.__getitem__, sort_order)):
+                treeview.move(item, "", index)
+
+        def load_rows():
+            page = search_filter["page"]
+            materials, has_next, paged = self.queries.material_page(
+                search_filter["filters"], sort_order, page, search_filter["paged"]
+            )
+            search_filter["paged"] = paged
+
+            shown = len(materials)
+            first = page * MATERIAL_PAGE_SIZE + 1 if shown else 0
+            page_label.config(
+                text=f"Сторінка {page + 1}: рядки {first}–{page * MATERIAL_PAGE_SIZE + shown}"
+                + (" (є наступні)" if has_next else "")
+            )
+            prev_page_button.config(state=tk.NORMAL if page > 0 else tk.DISABLED)
+            next_page_button.config(state=tk.NORMAL if has_next else tk.DISABLED)
+
+            treeview.delete(*treeview.get_children())
+            row_keys.clear()
+            for material in materials:
+                item = treeview.insert("", tk.END, iid=material[0], values=material)
+                row_keys[item] = material_sort_keys(material)
+
+            if sort_order and not paged:
+                sort_loaded_rows()
+
+        def change_page(step):
+            search_filter["page"] = max(0, search_filter["page"] + step)
+            load_rows()
+
+        def resort():
+            update_heading_labels()
+            if search_filter["paged"]:
+                search_filter["page"] = 0
+                load_rows()
+            else:
+                sort_loaded_rows()
+
+        def on_heading_click(col_index):
+            if sort_order and sort_order[0][0] == col_index:
+                sort_order[0] = (col_index, not sort_order[0][1])
+            else:
+                sort_order[:] = [(col_index, False)] + [key for key in sort_order if key[0] != col_index]
+            resort()
 
+        def apply_sort():
             sort_map = {
-                "Назвою": "Sort by Name",
-                "Датою": "Sort by Date",
-                "Статусом": "Sort by Status"
+                "Назвою": 1,
+                "Датою": 4,
+                "Статусом": 5
             }
 
-            sort_by = sort_map.get(sort_by)
-            if sort_by is None:  
+            col_index = sort_map.get(sort_combobox.get())
+            if col_index is None:  
                 messagebox.showerror("Помилка", "Некоректне значення для сортування.")
                 return
 
-            query = ("SELECT material_id, name, material_type, purpose, date_registered, status "
-                    "FROM Materials WHERE shelf_id = ? ORDER BY ")
-            query += {"Sort by Name": "name", "Sort by Date": "date_registered", "Sort by Status": "status"}[sort_by]
-
-            try:
-                materials = self.db.fetch_all(query, (shelf_id,))
-            except Exception as e:
-                messagebox.showerror("Помилка", f"Помилка при виконанні сортування: {e}")
-                return
-            for row in treeview.get_children():
-                treeview.delete(row)
-            for material in materials:
-                treeview.insert("", tk.END, values=material)
+            sort_order[:] = [(col_index, False)]
+            resort()
 
 
         def apply_search():
             search_text = search_entry.get().lower()
             status_filter = status_combobox.get()
 
-            query = "SELECT material_id, name, material_type, purpose, date_registered, status FROM Materials WHERE shelf_id = ?"
-            params = [shelf_id]
-
+            filters = {"shelf_id": shelf_id}
             if search_text:
-                query += " AND (name LIKE ? OR CAST(material_type AS TEXT) LIKE ? OR purpose LIKE ?)"
-                params.extend([f"%{search_text}%", f"%{search_text}%", f"%{search_text}%"])
-
+                filters["text"] = search_text
             if status_filter != "Всі":
-                query += " AND status = ?"
-                params.append(status_filter)
-
-            materials = self.db.fetch_all(query, tuple(params))
-
-            for row in treeview.get_children():
-                treeview.delete(row)
+                filters["status"] = status_filter
 
-            for material in materials:
-                treeview.insert("", tk.END, values=material)
+            search_filter.update(filters=filters, paged=False, page=0)
+            load_rows()
 
         editing_mode = tk.BooleanVar(value=False)
 
@@ -615,6 +1998,7 @@ class WarehouseApp:
                         return
 
                     treeview.set(selected_item, column=column, value=new_value)
+                    row_keys.pop(selected_item, None)
                     combobox.destroy()
                     self.changes_made = True
                     save_button.config(state=tk.NORMAL)
@@ -630,6 +2014,7 @@ class WarehouseApp:
                 def save_entry(event):
                     new_value = entry.get()
                     treeview.set(selected_item, column=column, value=new_value)
+                    row_keys.pop(selected_item, None)
                     entry.destroy()
                     self.changes_made = True
                     save_button.config(state=tk.NORMAL)
@@ -644,46 +2029,131 @@ class WarehouseApp:
 
         left_frame = tk.Frame(button_frame)
         left_frame.grid(row=0, column=0, padx=(10, 20))  
-        add_button = tk.Button(left_frame, text="Додати", state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED, font=("Arial", 14), command=lambda: self.add_material(editor_window, treeview, shelf_id))
+        add_button = tk.Button(left_frame, text="Додати", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=lambda: self.add_material(editor_window, treeview, shelf_id))
         add_button.pack(fill=tk.X, pady=5)
-        delete_button = tk.Button(left_frame, text="Видалити", state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED, font=("Arial", 14), command=lambda: delete_material())
+        delete_button = tk.Button(left_frame, text="Видалити", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=lambda: delete_material())
         delete_button.pack(fill=tk.X, pady=5)
+        scan_button = tk.Button(left_frame, text="Режим сканування", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=lambda: toggle_scan_mode())
+        scan_button.pack(fill=tk.X, pady=5)
 
         center_frame = tk.Frame(button_frame)
         center_frame.grid(row=0, column=1, padx=(20, 20))
-        edit_button = tk.Button(center_frame, text="Змінити на РЕДАГУВАННЯ", state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED, font=("Arial", 14), command=toggle_edit_mode)
+        edit_button = tk.Button(center_frame, text="Змінити на РЕДАГУВАННЯ", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=toggle_edit_mode)
         edit_button.pack(fill=tk.X, pady=5)
-        save_button = tk.Button(center_frame, text="Зберегти", state=tk.DISABLED, font=("Arial", 14), command=lambda: self.save_changes(treeview))
+        save_button = tk.Button(center_frame, text="Зберегти", state=tk.DISABLED, font=("Arial", 14), command=lambda: self.save_changes(treeview, journal))
         save_button.pack(fill=tk.X, pady=5)
+        undo_button = tk.Button(center_frame, text="Скасувати дію", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=lambda: undo_operation())
+        undo_button.pack(fill=tk.X, pady=5)
+        redo_button = tk.Button(center_frame, text="Повторити дію", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=lambda: redo_operation())
+        redo_button.pack(fill=tk.X, pady=5)
 
         right_frame = tk.Frame(button_frame)
         right_frame.grid(row=0, column=2, padx=(20, 10))
-        move_button = tk.Button(right_frame, text="Перемістити деталь", state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED, font=("Arial", 14), command=lambda: move_material())
+        move_button = tk.Button(right_frame, text="Перемістити деталь", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, font=("Arial", 14), command=lambda: move_material())
         move_button.pack(fill=tk.X, pady=5)
         view_deleted_button = tk.Button(right_frame, text="Видалені деталі", font=("Arial", 14), command=lambda:view_deleted_materials())
         view_deleted_button.pack(fill=tk.X, pady=5)
+        status_times_button = tk.Button(right_frame, text="Час у статусах", font=("Arial", 14), command=lambda: view_status_times())
+        status_times_button.pack(fill=tk.X, pady=5)
 
         apply_search()
+        self.shelf_editors[shelf_id] = (editor_window, lambda: apply_search())
+
+        scan_frame = tk.Frame(top_frame)
+        tk.Label(scan_frame, text="Скануйте штрихкод:", font=("Arial", 14)).grid(row=0, column=0, padx=10, sticky="w")
+        scan_entry = tk.Entry(scan_frame, font=("Arial", 14), width=30)
+        scan_entry.grid(row=0, column=1, padx=10, sticky="ew")
+        scan_status = tk.Label(scan_frame, text="", font=("Arial", 12))
+        scan_status.grid(row=0, column=2, padx=10, sticky="w")
+        scan_intake = None
+        scan_job = None
+
+        def on_scan(event):
+            scan_intake.submit(scan_entry.get())
+            scan_entry.delete(0, tk.END)
+            return "break"
+
+        scan_entry.bind("<Return>", on_scan)
+        scan_entry.bind("<Tab>", on_scan)
+
+        def flush_scans(reschedule=True):
+            nonlocal scan_job
+            updated = scan_intake.flush()
+            # Вікно редактора могли закрити — скани все одно записуємо
+            if not editor_window.winfo_exists():
+                return
+            for values in updated:
+                item = str(values[0])
+                if treeview.exists(item):
+                    treeview.item(item, values=values)
+                else:
+                    treeview.insert("", tk.END, iid=item, values=values)
+                row_keys[item] = material_sort_keys(values)
+            scan_status.config(text=f"Очікують запису: {scan_intake.pending_count()}")
+            if reschedule:
+                scan_job = self.root.after(SCAN_FLUSH_INTERVAL_MS, flush_scans)
+
+        def toggle_scan_mode():
+            nonlocal scan_intake
+            if scan_intake is None:
+                scan_intake = ScanIntake(self.db, self.trigram_index, shelf_id)
+                scan_frame.grid(row=1, column=0, padx=10, pady=10, sticky="w")
+                scan_button.config(text="Завершити сканування")
+                scan_entry.focus()
+                flush_scans()
+            else:
+                self.root.after_cancel(scan_job)
+                flush_scans(reschedule=False)
+                scan_intake = None
+                scan_frame.grid_remove()
+                scan_button.config(text="Режим сканування")
+
+        def close_editor():
+            # Закрите вікно редактора лише ховається і при наступному відкритті оновлює дані;
+            # режим сканування завершується, щоб таймер запису не працював для прихованого вікна
+            if scan_intake is not None:
+                toggle_scan_mode()
+            editor_window.withdraw()
+
+        editor_window.protocol("WM_DELETE_WINDOW", close_editor)
+
+
+
+
+        def refresh_rows(material_ids):
+            # Оновлює лише рядки, яких торкнулася операція, без повторного запиту всього стелажу
+            for material_id in material_ids:
+                item = str(material_id)
+                row_keys.pop(item, None)
+                material = self.queries.fetch_one("material_on_shelf", (material_id, shelf_id))
+                if material is None:
+                    if treeview.exists(item):
+                        treeview.delete(item)
+                elif treeview.exists(item):
+                    treeview.item(item, values=material)
+                else:
+                    treeview.insert("", tk.END, iid=item, values=material)
+
+        def undo_operation(event=None):
+            # Ctrl+Z у полі пошуку чи сканування стосується тексту поля, а не журналу
+            if event is not None and isinstance(event.widget, (tk.Entry, ttk.Entry)):
+                return
+            refresh_rows(journal.undo())
 
+        def redo_operation(event=None):
+            if event is not None and isinstance(event.widget, (tk.Entry, ttk.Entry)):
+                return
+            refresh_rows(journal.redo())
 
-
+        editor_window.bind("<Control-z>", undo_operation)
+        editor_window.bind("<Control-y>", redo_operation)
 
         def delete_material():
-            selected_item = treeview.selection()
-            if not selected_item:
+            selected_items = treeview.selection()
+            if not selected_items:
                 return
-            material_id = treeview.item(selected_item, "values")[0]
-            material = self.db.fetch_one("SELECT * FROM Materials WHERE material_id = ?", (material_id,))
-            if material:
-                self.db.execute_query(
-                    "INSERT INTO DeletedMaterials (material_id, name, shelf_id, material_type, purpose, date_registered, status, date_deleted) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                    (material[0], material[1], material[2], material[3], material[4], material[5], material[6], 
-                    datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                )
-                self.db.execute_query("DELETE FROM Materials WHERE material_id = ?", (material_id,))
-                
-                apply_search()
+            group = [("delete", int(treeview.item(item, "values")[0])) for item in selected_items]
+            refresh_rows(journal.execute(group))
 
 
 
@@ -694,15 +2164,15 @@ class WarehouseApp:
                 messagebox.showwarning("Помилка", "Будь ласка, виберіть деталь для переміщення.")
                 return
 
-            material_id = treeview.item(selected_item, "values")[0]
+            selected_rows = [treeview.item(item, "values") for item in selected_item]
 
             move_window = tk.Toplevel(editor_window)
             move_window.title("Перемістити деталь")
-            move_window.geometry("400x300")
+            move_window.geometry("400x380")
 
             tk.Label(move_window, text="Оберіть новий стелаж:", font=("Arial", 12)).pack(pady=10)
 
-            shelves = self.db.fetch_all("SELECT shelf_id, description FROM Shelves")
+            shelves = self.queries.fetch_all("shelves")
             if not shelves:
                 messagebox.showerror("Помилка", "Немає доступних стелажів для переміщення.")
                 move_window.destroy()
@@ -715,6 +2185,14 @@ class WarehouseApp:
             shelf_dropdown = ttk.Combobox(move_window, textvariable=selected_shelf, values=shelf_options, state="readonly")
             shelf_dropdown.pack(pady=10)
 
+            # Частину кількості можна перемістити лише для однієї обраної деталі
+            tk.Label(move_window, text="Кількість:", font=("Arial", 12)).pack(pady=5)
+            quantity_entry = tk.Entry(move_window, font=("Arial", 12))
+            quantity_entry.insert(0, str(selected_rows[0][2]))
+            quantity_entry.pack(pady=5)
+            if len(selected_rows) > 1:
+                quantity_entry.config(state=tk.DISABLED)
+
             def confirm_move():
                 target_shelf_id = int(selected_shelf.get().split(":")[0])
 
@@ -723,12 +2201,16 @@ class WarehouseApp:
                     return
 
                 try:
-                    self.db.execute_query("UPDATE Materials SET shelf_id = ? WHERE material_id = ?", (target_shelf_id, material_id))
+                    group = move_group(selected_rows, shelf_id, target_shelf_id, quantity_entry.get())
+                except ValueError as e:
+                    messagebox.showwarning("Помилка", str(e))
+                    return
+
+                affected = journal.execute(group)
+                if affected:
                     messagebox.showinfo("Успіх", "Деталь успішно переміщено.")
-                    apply_search()  
+                    refresh_rows(affected)
                     move_window.destroy()
-                except Exception as e:
-                    messagebox.showerror("Помилка", f"Не вдалося перемістити деталь: {e}")
 
             tk.Button(move_window, text="Перемістити", command=confirm_move, font=("Arial", 12)).pack(pady=20)
             tk.Button(move_window, text="Скасувати", command=move_window.destroy, font=("Arial", 12)).pack()
@@ -752,7 +2234,7 @@ class WarehouseApp:
             treeview_deleted.configure(yscrollcommand=scrollbar.set)
             scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-            materials = self.db.fetch_all("SELECT material_id, name, material_type, purpose, date_registered, status, date_deleted FROM DeletedMaterials WHERE shelf_id = ?", (shelf_id,))
+            materials = self.queries.fetch_all("deleted_materials_on_shelf", (shelf_id,))
             
             for material in materials:
                 treeview_deleted.insert("", tk.END, values=material)
@@ -763,7 +2245,10 @@ class WarehouseApp:
                     return
 
                 material_id = treeview_deleted.item(selected_item, "values")[0]
-                material = self.db.fetch_one("SELECT * FROM DeletedMaterials WHERE material_id = ?", (material_id,))
+                material = self.queries.fetch_one("deleted_material", (material_id,))
+                if self.queries.fetch_one("material_exists", (material_id,)):
+                    messagebox.showwarning("Увага", f"Деталь із ID {material_id} вже є на складі. Запустіть перевірку цілісності.")
+                    return
                 if material:
                     self.db.execute_query(
                         "INSERT INTO Materials (material_id, name, shelf_id, material_type, purpose, date_registered, status) "
@@ -771,51 +2256,71 @@ class WarehouseApp:
                         (material[0], material[1], material[2], material[3], material[4], material[5], material[6])
                     )
                     self.db.execute_query("DELETE FROM DeletedMaterials WHERE material_id = ?", (material_id,))
+                    self.trigram_index.index_material(material[0])
                     apply_search()
 
-            restore_button = tk.Button(deleted_window, text="Повернути деталь", state=tk.NORMAL if self.user.role in ["admin", "worker"] else tk.DISABLED, command=restore_material)
+            restore_button = tk.Button(deleted_window, text="Повернути деталь", state=tk.NORMAL if self.user.has_role("admin", "worker") else tk.DISABLED, command=restore_material)
             restore_button.pack(pady=5)
 
+        def view_status_times():
+            times_window = tk.Toplevel(self.root)
+            times_window.title("Час у статусах")
+            times_window.geometry("1100x400")
+
+            def format_duration(seconds):
+                if seconds is None:
+                    return "—"
+                days, rest = divmod(int(seconds), 86400)
+                return f"{days} д {rest // 3600} год"
+
+            time_columns = ("Статус", "Переходів (стелаж)", "Середнє (стелаж)", "Медіана (стелаж)", "90% (стелаж)", "Середнє (усі)", "90% (усі)")
+            treeview_times = ttk.Treeview(times_window, columns=time_columns, show="headings")
+            for col in time_columns:
+                treeview_times.heading(col, text=col)
+                treeview_times.column(col, width=150, anchor="center")
+            treeview_times.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+            for status in STATUS_VALUES:
+                shelf_stats = self.status_history.time_in_status(status, shelf_id)
+                overall_stats = self.status_history.time_in_status(status)
+                treeview_times.insert("", tk.END, values=(
+                    status,
+                    shelf_stats["count"],
+                    format_duration(shelf_stats["average"]),
+                    format_duration(shelf_stats["p50"]),
+                    format_duration(shelf_stats["p90"]),
+                    format_duration(overall_stats["average"]),
+                    format_duration(overall_stats["p90"]),
+                ))
+
         
 
 
-    def save_changes(self, treeview):
-        changes_made = False
+    def save_changes(self, treeview, journal):
+        group = []
         for item in treeview.get_children():
             item_values = treeview.item(item, "values")
             material_id = item_values[0]
 
-            current_values = self.db.fetch_one(
-                "SELECT name, material_type, purpose, date_registered, status FROM Materials WHERE material_id = ?",
-                (material_id,)
-            )
+            current_values = self.queries.fetch_one("material_for_update", (material_id,))
 
             if not current_values:
                 messagebox.showwarning("Увага", f"Деталь із ID {material_id} не знайдено в базі даних. Пропускаємо.")
                 continue
 
             changes = []
-            fields = ["name", "material_type", "purpose", "date_registered", "status"]
-            for idx, field in enumerate(fields):
-                if current_values[idx] != item_values[idx + 1]: 
-                    changes.append(f"{field}: {current_values[idx]} -> {item_values[idx + 1]}")
+            for idx, field in enumerate(OperationJournal.UPDATE_COLUMNS):
+                if str(current_values[idx]) != str(item_values[idx + 1]):
+                    changes.append((field, current_values[idx], item_values[idx + 1]))
 
             if changes:
-                try:
-                    self.db.execute_query(
-                        """
-                        UPDATE Materials 
-                        SET name = ?, material_type = ?, purpose = ?, date_registered = ?, status = ? 
-                        WHERE material_id = ?
-                        """,
-                        (item_values[1], item_values[2], item_values[3], item_values[4], item_values[5], material_id),
-                    )
-                    changes_made = True
-                except Exception as e:
-                    messagebox.showerror("Помилка", f"Не вдалося зберегти зміни для матеріалу з ID {material_id}: {e}")
+                group.append(("update", int(material_id), current_values[5], tuple(changes)))
 
-    
+        # Усі зміни зберігаються однією транзакцією і скасовуються як одна дія
+        if group and not journal.execute(group):
+            messagebox.showerror("Помилка", "Не вдалося зберегти зміни.")
 
+    
 
     def add_material(self, parent_window, treeview, shelf_id):
         add_material_window = tk.Toplevel(parent_window)
@@ -865,13 +2370,14 @@ class WarehouseApp:
                 return
 
             try:
-                self.db.execute_query(""" 
-                    INSERT INTO Materials (name, shelf_id, material_type, purpose, date_registered, status) 
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (material_name, shelf_id, quantity, catalog_number, date_registered, material_status))
+                self.db.execute_query(
+                    QueryRegistry.statement("insert_material"),
+                    (material_name, shelf_id, quantity, catalog_number, date_registered, material_status),
+                )
 
                 material_id = self.db.fetch_one("SELECT last_insert_rowid()")[0]
-                treeview.insert("", tk.END, values=(material_id, material_name, quantity, catalog_number, date_registered, material_status))
+                self.trigram_index.index_material(material_id)
+                treeview.insert("", tk.END, iid=material_id, values=(material_id, material_name, quantity, catalog_number, date_registered, material_status))
 
                 add_material_window.destroy()
             except sqlite3.Error as e:
@@ -896,16 +2402,59 @@ class WarehouseApp:
 
 
     def clear_window(self):
+            # Кешовані екрани ховаються, відкриті редактори стелажів лишаються, решта віджетів знищується
+            screens = set(self.screens.values())
+            editors = {editor_window for editor_window, _ in self.shelf_editors.values()}
             for widget in self.root.winfo_children():
-                widget.destroy()
+                if widget in screens:
+                    widget.pack_forget()
+                elif widget not in editors:
+                    widget.destroy()
 
 def main():
     root = tk.Tk()  
     root.mainloop()
 
 if __name__ == "__main__":
+    # Нічний запуск без інтерфейсу: python sklad_nyva.py --reports [каталог]
+    if len(sys.argv) > 1 and sys.argv[1] == "--reports":
+        db = Database("sklad_nyva.db")
+        DatabaseSetup(db)
+        regenerated = ReportEngine(db, sys.argv[2] if len(sys.argv) > 2 else REPORTS_DIR).generate()
+        print(f"Оновлено звітів: {len(regenerated)}")
+        db.close()
+        sys.exit(0)
+
+    # План виконання та середній час кожного зареєстрованого запиту: python sklad_nyva.py --explain-queries
+    if len(sys.argv) > 1 and sys.argv[1] == "--explain-queries":
+        db = Database("sklad_nyva.db")
+        DatabaseSetup(db)
+        queries = QueryRegistry(db, TrigramIndex(db))
+        statements = {name: (query, params) for name, (query, _, params) in QueryRegistry.STATEMENTS.items()}
+        statements["materials"] = queries.materials_query({"shelf_id": 1, "text": "болт"}, limit=MATERIAL_PAGE_SIZE)
+        for name, (query, params) in statements.items():
+            try:
+                print(f"{name}: {queries.benchmark(query, params, repeat=10) * 1000:.3f} мс")
+            except sqlite3.Error as e:
+                # Зразок параметрів може не відповідати даним конкретної бази, наприклад через зовнішні ключі
+                print(f"{name}: {e}")
+            for row in queries.explain(query, params):
+                print(f"    {row[-1]}")
+        db.close()
+        sys.exit(0)
+
+    # Час холодного запуску до першого відмальованого екрана; --startup-time виводить його і завершує роботу
     root = tk.Tk()
     root.title("Skald Nyva")
     db = Database("sklad_nyva.db")  
     app = WarehouseApp(root, db)  
+    root.update_idletasks()
+    startup_seconds = time.perf_counter() - STARTED_AT
+    if startup_seconds > STARTUP_BUDGET_SECONDS:
+        print(f"Запуск зайняв {startup_seconds:.3f} с, бюджет {STARTUP_BUDGET_SECONDS} с", file=sys.stderr)
+    if "--startup-time" in sys.argv:
+        print(f"{startup_seconds:.3f}")
+        root.destroy()
+        db.close()
+        sys.exit(0 if startup_seconds <= STARTUP_BUDGET_SECONDS else 1)
     root.mainloop()
@@ -0,0 +1,510 @@
+import datetime
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import sklad_nyva  # noqa: E402
+from sklad_nyva import (  # noqa: E402
+    ConsistencyChecker,
+    Database,
+    DatabaseSetup,
+    OperationJournal,
+    QueryRegistry,
+    ReportEngine,
+    ScanIntake,
+    StatusHistory,
+    TrigramIndex,
+    User,
+    hash_password,
+    material_sort_keys,
+    move_group,
+    sort_by_keys,
+    verify_password,
+)
+
+
+@pytest.fixture(autouse=True)
+def errors(monkeypatch):
+    # Тести працюють без дисплея, тому діалоги лише записуються
+    shown = []
+    for name in ("showerror", "showwarning", "showinfo"):
+        monkeypatch.setattr(sklad_nyva.messagebox, name, lambda title, message, shown=shown: shown.append(message))
+    return shown
+
+
+def open_database(db_file=":memory:"):
+    db = Database(db_file)
+    DatabaseSetup(db)
+    db.execute_query("INSERT INTO Shelves (shelf_number, description) VALUES (1, 'A'), (2, 'B')")
+    return db
+
+
+def add_material(db, name, shelf_id, quantity, catalog_number, status="Справний", date_registered="2024-01-01 00:00:00"):
+    db.execute_query(
+        "INSERT INTO Materials (name, shelf_id, material_type, purpose, date_registered, status) VALUES (?, ?, ?, ?, ?, ?)",
+        (name, shelf_id, quantity, catalog_number, date_registered, status),
+    )
+    return db.cursor.lastrowid
+
+
+def materials(db):
+    return db.fetch_all("SELECT material_id, shelf_id, CAST(material_type AS INTEGER), status FROM Materials ORDER BY material_id")
+
+
+@pytest.fixture
+def db():
+    db = open_database()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def trigram_index(db):
+    return TrigramIndex(db)
+
+
+@pytest.fixture
+def journal(db, trigram_index):
+    return OperationJournal(db, trigram_index, StatusHistory(db))
+
+
+class TestMaterialSorting:
+    def test_sort_keys_compare_numbers_and_dates_by_value(self):
+        rows = [
+            (1, "болт", "10", "b-2", "2024-02-01 00:00:00", "Справний"),
+            (2, "Анкер", "9", "B-10", "2023-12-31 23:59:59", "Справний"),
+            (3, "втулка", "бухта", "a-1", "не вказано", "Справний"),
+        ]
+        keys = {row[0]: material_sort_keys(row) for row in rows}
+
+        assert sorted(keys, key=lambda material_id: keys[material_id][2]) == [2, 1, 3]
+        assert sorted(keys, key=lambda material_id: keys[material_id][4]) == [2, 1, 3]
+        assert sorted(keys, key=lambda material_id: keys[material_id][1]) == [2, 1, 3]
+
+    def test_multi_key_sort_is_stable(self):
+        rows = [
+            (1, "b", "1", "C1", "2024-01-01 00:00:00", "Несправний"),
+            (2, "a", "1", "C2", "2024-01-01 00:00:00", "Справний"),
+            (3, "b", "2", "C3", "2024-01-01 00:00:00", "Справний"),
+            (4, "a", "3", "C4", "2024-01-01 00:00:00", "Несправний"),
+            (5, "b", "4", "C5", "2024-01-01 00:00:00", "Справний"),
+        ]
+        keys = {row[0]: material_sort_keys(row) for row in rows}
+
+        # Статус за зростанням, далі назва за спаданням; рівні рядки лишаються в початковому порядку
+        ordered = sort_by_keys([1, 2, 3, 4, 5], keys.__getitem__, [(5, False), (1, True)])
+        assert ordered == [1, 4, 3, 5, 2]
+
+    def test_small_selection_is_sorted_by_the_editor(self, db, trigram_index):
+        for name in ("c", "a", "b"):
+            add_material(db, name, 1, 1, "C1")
+        queries = QueryRegistry(db, trigram_index)
+
+        rows, has_next, paged = queries.material_page({"shelf_id": 1}, [(1, False)], page_size=5)
+
+        assert (has_next, paged) == (False, False)
+        assert [row.material_id for row in rows] == [1, 2, 3]
+
+    def test_large_selection_is_sorted_by_sql_across_pages(self, db, trigram_index):
+        for name, status in (("b", "Справний"), ("a", "Несправний"), ("c", "Справний"), ("a", "Справний"), ("b", "Несправний")):
+            add_material(db, name, 1, 1, "C1", status=status)
+        queries = QueryRegistry(db, trigram_index)
+        sort_order = [(5, False), (1, True)]
+
+        pages, page, paged, has_next = [], 0, False, True
+        while has_next:
+            rows, has_next, paged = queries.material_page({"shelf_id": 1}, sort_order, page, paged, page_size=2)
+            assert paged
+            pages.append([row.material_id for row in rows])
+            page += 1
+
+        assert pages == [[5, 2], [3, 1], [4]]
+
+
+class TestTrigramIndex:
+    def search(self, db, trigram_index, shelf_id, text):
+        return [row.material_id for row in QueryRegistry(db, trigram_index).materials({"shelf_id": shelf_id, "text": text})]
+
+    def test_search_tolerates_typos(self, db, trigram_index):
+        add_material(db, "Підшипник кульковий", 1, 1, "6204")
+        add_material(db, "Гайка М10", 1, 1, "G10")
+        trigram_index.rebuild()
+
+        assert self.search(db, trigram_index, 1, "підшипнек") == [1]
+
+    def test_search_is_scoped_to_the_shelf(self, db, trigram_index):
+        add_material(db, "Болт М8", 1, 1, "C1")
+        add_material(db, "Болт М8", 2, 1, "C1")
+        trigram_index.rebuild()
+
+        assert self.search(db, trigram_index, 2, "болт") == [2]
+
+    def test_moved_material_is_found_on_the_new_shelf(self, db, trigram_index, journal):
+        add_material(db, "Болт М8", 1, 1, "C1")
+        trigram_index.rebuild()
+        journal.execute([("move", 1, 1, 2)])
+
+        assert self.search(db, trigram_index, 1, "болт") == []
+        assert self.search(db, trigram_index, 2, "болт") == [1]
+
+    def test_query_plan_uses_shelf_prefix(self, db, trigram_index):
+        queries = QueryRegistry(db, trigram_index)
+        query, params = queries.materials_query({"shelf_id": 1, "text": "болт"})
+        plan = " ".join(row[-1] for row in queries.explain(query, params))
+
+        assert "MaterialTrigrams USING PRIMARY KEY (shelf_id=? AND trigram=?)" in plan
+        assert "LIKE" not in query
+
+    @pytest.mark.parametrize("text, expected", [("10", [1, 2]), ("8", [1]), ("-", [1])])
+    def test_short_query_finds_every_substring(self, db, trigram_index, text, expected):
+        add_material(db, "Болт М8", 1, 1, "BLT-100")
+        add_material(db, "Гайка М10", 1, 1, "G10")
+        add_material(db, "Шайба", 1, 1, "W5")
+        trigram_index.rebuild()
+
+        assert sorted(self.search(db, trigram_index, 1, text)) == expected
+
+    def test_mid_word_query_finds_the_substring(self, db, trigram_index):
+        add_material(db, "Підшипник кульковий", 1, 1, "6204")
+        add_material(db, "Шпилька", 1, 1, "S1")
+        trigram_index.rebuild()
+
+        assert self.search(db, trigram_index, 1, "шип") == [1]
+        assert self.search(db, trigram_index, 1, "ульк") == [1]
+
+    def test_quantity_is_searchable_after_a_change(self, db, trigram_index, journal):
+        add_material(db, "Кабель", 1, 5, "K1")
+        trigram_index.rebuild()
+        journal.execute([("update", 1, 1, (("material_type", "5", "бухта"),))])
+
+        assert self.search(db, trigram_index, 1, "бух") == [1]
+
+
+class TestScanIntake:
+    def scan(self, db, trigram_index, *codes):
+        intake = ScanIntake(db, trigram_index, 1)
+        for code in codes:
+            intake.submit(code)
+        intake.drain()
+        return intake.flush()
+
+    def test_repeated_scans_are_merged_into_one_row(self, db, trigram_index):
+        add_material(db, "Болт", 1, 10, "C1")
+        self.scan(db, trigram_index, "C1", "C1", " C1 ")
+
+        assert materials(db) == [(1, 1, 13, "Справний")]
+
+    def test_scan_does_not_add_to_rows_with_other_status(self, db, trigram_index):
+        add_material(db, "Болт", 1, 10, "C1", status="Списаний")
+        updated = self.scan(db, trigram_index, "C1")
+
+        assert materials(db) == [(1, 1, 10, "Списаний"), (2, 1, 1, "Справний")]
+        assert [row[0] for row in updated] == [2]
+
+    def test_scan_does_not_add_to_rows_with_non_numeric_quantity(self, db, trigram_index):
+        add_material(db, "Кабель", 1, "бухта", "K1")
+        self.scan(db, trigram_index, "K1")
+
+        assert db.fetch_all("SELECT material_id, material_type FROM Materials ORDER BY material_id") == [
+            (1, "бухта"), (2, "1"),
+        ]
+
+
+class TestReportEngine:
+    def test_unchanged_shelf_is_regenerated_only_at_an_aging_boundary(self, tmp_path, monkeypatch):
+        db = open_database(str(tmp_path / "sklad.db"))
+        add_material(db, "Болт", 1, 1, "C1", date_registered="2024-01-01 10:00:00")
+        engine = ReportEngine(db, tmp_path / "reports", max_workers=1)
+        today = datetime.date(2024, 1, 10)
+
+        class Today(datetime.date):
+            @classmethod
+            def today(cls):
+                return today
+
+        monkeypatch.setattr(sklad_nyva.datetime, "date", Today)
+        assert engine.generate() == [1, 2]
+        assert engine.generate() == []
+
+        today = datetime.date(2024, 1, 31)
+        assert engine.generate() == []
+
+        # 2024-02-01 позиції виповнюється 30 днів; порожній стелаж більше не перегенеровується
+        today = datetime.date(2024, 2, 1)
+        assert engine.generate() == [1]
+        assert "30-90 днів" in (tmp_path / "reports" / "shelf_1.html").read_text(encoding="utf-8")
+        assert engine.generate() == []
+        db.close()
+
+
+class TestStatusHistory:
+    def test_percentiles_are_close_to_exact_values(self, db):
+        history = StatusHistory(db)
+        entered_at = datetime.datetime(2024, 1, 1)
+        for seconds in range(1000, 2000):
+            history._add_duration(1, "Справний", "2024-01-01 00:00:00", entered_at + datetime.timedelta(seconds=seconds))
+
+        stats = history.time_in_status("Справний", shelf_id=1)
+
+        assert stats["count"] == 1000
+        assert stats["p50"] == pytest.approx(1500, rel=0.05)
+        assert stats["p90"] == pytest.approx(1900, rel=0.05)
+
+    def test_previous_transition_is_taken_by_insertion_order(self, db):
+        add_material(db, "Болт", 1, 1, "C1")
+        db.cursor.executemany(
+            "INSERT INTO StatusHistory (material_id, shelf_id, old_status, new_status, changed_at) VALUES (1, 1, ?, ?, ?)",
+            [("Справний", "Несправний", "2024-06-01 00:00:00"), ("Несправний", "Справний", "2024-03-01 00:00:00")],
+        )
+        history = StatusHistory(db)
+        history.record_transition(1, 1, "Справний", "Несправний")
+
+        total = db.fetch_one("SELECT total_seconds FROM StatusDurations WHERE status = 'Справний'")[0]
+        expected = (datetime.datetime.now() - datetime.datetime(2024, 3, 1)).total_seconds()
+        assert total == pytest.approx(expected, abs=5)
+
+
+class TestConsistencyChecker:
+    def checker(self, db, trigram_index):
+        return ConsistencyChecker(db, trigram_index, StatusHistory(db), chunk_size=2)
+
+    def test_findings_survive_a_resumed_pass(self, db, trigram_index):
+        for i in range(6):
+            add_material(db, f"m{i}", 1, 1, f"C{i}", status="bad" if i in (0, 5) else "Справний")
+        assert self.checker(db, trigram_index).run(max_chunks=1) == ([], False)
+
+        # Новий екземпляр — як після перезапуску програми
+        checker = self.checker(db, trigram_index)
+        issues, done = [], False
+        while not done:
+            issues, done = checker.run(max_chunks=1)
+
+        assert issues == [("invalid_status", "Materials", 1), ("invalid_status", "Materials", 6)]
+        assert db.fetch_all("SELECT * FROM ConsistencyCheckpoints") == []
+        assert db.fetch_all("SELECT * FROM ConsistencyFindings") == []
+
+    def test_repair_skips_rows_fixed_in_the_meantime(self, db, trigram_index):
+        add_material(db, "a", 1, 1, "C1", status="bad")
+        add_material(db, "b", 1, 1, "C2", status="bad")
+        checker = self.checker(db, trigram_index)
+        issues, done = checker.run()
+        assert done and len(issues) == 2
+        db.execute_query("UPDATE Materials SET status = 'Несправний' WHERE material_id = 2")
+
+        checker.repair(issues)
+
+        assert materials(db) == [(1, 1, 1, ConsistencyChecker.REPAIR_STATUS), (2, 1, 1, "Несправний")]
+        assert db.fetch_all("SELECT material_id, old_status, new_status FROM StatusHistory") == [
+            (1, "bad", ConsistencyChecker.REPAIR_STATUS)
+        ]
+
+    def test_repair_does_not_delete_material_whose_shelf_reappeared(self, db, trigram_index):
+        add_material(db, "a", 3, 1, "C1")
+        checker = self.checker(db, trigram_index)
+        issues, _ = checker.run()
+        assert issues == [("orphan_material", "Materials", 1)]
+        db.execute_query("INSERT INTO Shelves (shelf_id, shelf_number, description) VALUES (3, 3, 'C')")
+
+        checker.repair(issues)
+
+        assert materials(db) == [(1, 3, 1, "Справний")]
+
+    def test_failed_foreign_key_check_is_not_repeated_on_startup(self, db, trigram_index, monkeypatch):
+        add_material(db, "a", 3, 1, "C1")
+        checker = self.checker(db, trigram_index)
+        assert checker.enable_foreign_keys() is False
+
+        checks = []
+        fetch_one = db.fetch_one
+        monkeypatch.setattr(db, "fetch_one", lambda query, params=(): checks.append(query) or fetch_one(query, params))
+        assert checker.enable_foreign_keys() is False
+        assert "PRAGMA foreign_key_check" not in checks
+
+        issues, _ = checker.run()
+        checker.repair(issues)
+        assert checker.enable_foreign_keys(recheck=True) is True
+        assert db.fetch_one("PRAGMA foreign_keys") == (1,)
+
+
+class TestDatabaseSetup:
+    def test_current_schema_skips_ddl(self, tmp_path):
+        db = open_database(str(tmp_path / "sklad.db"))
+        db.execute_query("DROP TABLE MaterialTrigramCounts")
+        statements = []
+        db.connection.set_trace_callback(statements.append)
+
+        setup = DatabaseSetup(db)
+
+        assert setup.upgraded is False
+        assert not [sql for sql in statements if sql.lstrip().startswith("CREATE")]
+        assert db.fetch_one("SELECT name FROM sqlite_master WHERE name = 'MaterialTrigramCounts'") is None
+        db.close()
+
+    def test_outdated_schema_is_created_in_one_pass(self, tmp_path):
+        db = open_database(str(tmp_path / "sklad.db"))
+        db.execute_query("PRAGMA user_version = 0")
+
+        assert DatabaseSetup(db).upgraded is True
+        assert db.fetch_one("PRAGMA user_version") == (sklad_nyva.SCHEMA_VERSION,)
+        db.close()
+
+
+class TestQueryRegistry:
+    def test_unknown_registered_query_raises_value_error(self, db, trigram_index):
+        queries = QueryRegistry(db, trigram_index)
+        with pytest.raises(ValueError):
+            queries.fetch_all("no_such_query")
+        with pytest.raises(ValueError):
+            queries.fetch_one("no_such_query")
+
+    @pytest.mark.parametrize("name", sorted(QueryRegistry.STATEMENTS))
+    def test_registered_query_runs_with_its_sample_params(self, db, trigram_index, name):
+        add_material(db, "Болт М8", 1, 5, "C1")
+        queries = QueryRegistry(db, trigram_index)
+        query, _, params = QueryRegistry.STATEMENTS[name]
+
+        # Невідповідність зразка кількості параметрів запиту дала б sqlite3.ProgrammingError
+        queries.explain(query, params)
+        queries.benchmark(query, params, repeat=2)
+
+        assert materials(db) == [(1, 1, 5, "Справний")]
+        assert db.fetch_all("SELECT * FROM MovementLedger") == []
+
+
+class TestPasswords:
+    def test_hash_round_trip(self):
+        stored = hash_password("secret", iterations=1000)
+        assert verify_password("secret", stored) == (True, True)
+        assert verify_password("wrong", stored) == (False, False)
+
+    def test_plain_text_password_needs_upgrade(self):
+        assert verify_password("secret", "secret") == (True, True)
+
+    @pytest.mark.parametrize("stored", [
+        "pbkdf2_sha256$abc$00$00",
+        "pbkdf2_sha256$0$00$00",
+        "pbkdf2_sha256$1000$zz$00",
+    ])
+    def test_malformed_hash_is_a_failed_login(self, stored):
+        assert verify_password("secret", stored) == (False, False)
+
+    def test_unknown_user_runs_a_dummy_verify(self, db, monkeypatch):
+        checked = []
+        monkeypatch.setattr(sklad_nyva, "verify_password", lambda password, stored: checked.append(stored) or (False, False))
+
+        assert not User(db, "nobody", "secret").login()
+        assert checked == [sklad_nyva.DUMMY_PASSWORD_HASH]
+
+
+class TestOperationJournal:
+    def test_transfer_undo_refuses_when_target_quantity_is_gone(self, db, trigram_index, journal, errors):
+        add_material(db, "Болт", 1, 10, "C1")
+        trigram_index.rebuild()
+        assert journal.execute([("transfer", 1, 1, 2, 4)]) == {1, 2}
+        db.execute_query("UPDATE Materials SET material_type = '1' WHERE material_id = 2")
+
+        assert journal.undo() == set()
+        assert materials(db) == [(1, 1, 6, "Справний"), (2, 2, 1, "Справний")]
+        assert errors
+
+    def test_transfer_undo_keeps_later_additions_to_created_target(self, db, journal):
+        add_material(db, "Болт", 1, 10, "C1")
+        journal.execute([("transfer", 1, 1, 2, 4)])
+        db.execute_query("UPDATE Materials SET material_type = '7' WHERE material_id = 2")
+
+        assert journal.undo() == {1, 2}
+        assert materials(db) == [(1, 1, 10, "Справний"), (2, 2, 3, "Справний")]
+
+    def test_whole_row_undo_refuses_when_quantity_changed(self, db, journal, errors):
+        add_material(db, "Болт", 1, 10, "C1")
+        journal.execute([("transfer", 1, 1, 2, 10)])
+        db.execute_query("UPDATE Materials SET material_type = '12' WHERE material_id = 1")
+
+        assert journal.undo() == set()
+        assert materials(db) == [(1, 2, 12, "Справний")]
+        assert errors
+
+    def test_redo_revalidates_available_quantity(self, db, journal, errors):
+        add_material(db, "Болт", 1, 10, "C1")
+        journal.execute([("transfer", 1, 1, 2, 10)])
+        journal.undo()
+        db.execute_query("UPDATE Materials SET material_type = '3' WHERE material_id = 1")
+
+        assert journal.redo() == set()
+        assert materials(db) == [(1, 1, 3, "Справний")]
+        assert errors
+
+    def test_transfer_round_trip_merges_into_matching_target(self, db, journal):
+        add_material(db, "Болт", 1, 10, "C1")
+        add_material(db, "Болт", 2, 5, "C1")
+        add_material(db, "Болт", 2, 5, "C1", status="Несправний")
+
+        assert journal.execute([("transfer", 1, 1, 2, 10)]) == {1, 2}
+        assert materials(db) == [(2, 2, 15, "Справний"), (3, 2, 5, "Несправний")]
+        journal.undo()
+        assert materials(db) == [(1, 1, 10, "Справний"), (2, 2, 5, "Справний"), (3, 2, 5, "Несправний")]
+        journal.redo()
+        assert materials(db) == [(2, 2, 15, "Справний"), (3, 2, 5, "Несправний")]
+
+    def test_zero_quantity_row_is_moved_whole_within_a_group(self, db, journal):
+        add_material(db, "Болт", 1, 0, "C1")
+        add_material(db, "Гайка", 1, 5, "C2")
+        rows = [(1, "Болт", "0"), (2, "Гайка", "5")]
+
+        group = move_group(rows, 1, 2)
+
+        assert group == [("move", 1, 1, 2), ("transfer", 2, 1, 2, 5)]
+        assert journal.execute(group) == {1, 2}
+        assert materials(db) == [(1, 2, 0, "Справний"), (2, 2, 5, "Справний")]
+
+    def test_single_row_quantity_is_validated(self):
+        with pytest.raises(ValueError):
+            move_group([(1, "Болт", "5")], 1, 2, "6")
+        assert move_group([(1, "Болт", "0")], 1, 2, "0") == [("move", 1, 1, 2)]
+
+    def test_move_is_written_to_ledger(self, db, journal):
+        add_material(db, "Кабель", 1, "бухта", "C2")
+        journal.execute([("move", 1, 1, 2)])
+        journal.undo()
+
+        ledger = db.fetch_all("SELECT source_material_id, from_shelf_id, to_shelf_id, quantity FROM MovementLedger")
+        assert ledger == [(1, 1, 2, "бухта"), (1, 2, 1, "бухта")]
+
+    def test_move_refuses_when_row_left_the_shelf(self, db, journal, errors):
+        add_material(db, "Кабель", 1, 3, "C2")
+        journal.execute([("move", 1, 1, 2)])
+        journal.undo()
+        db.execute_query("UPDATE Materials SET shelf_id = 2 WHERE material_id = 1")
+
+        assert journal.redo() == set()
+        assert errors
+    def test_update_undo_restores_only_changed_columns(self, db, journal):
+        add_material(db, "Болт", 1, 10, "C1")
+        journal.execute([("update", 1, 1, (("name", "Болт", "Болт М8"),))])
+        db.execute_query("UPDATE Materials SET material_type = '15' WHERE material_id = 1")
+
+        assert journal.undo() == {1}
+        assert db.fetch_one("SELECT name, material_type FROM Materials") == ("Болт", "15")
+
+    def test_update_undo_refuses_when_row_no_longer_matches(self, db, trigram_index, errors):
+        add_material(db, "Болт", 1, 10, "C1")
+        journal = OperationJournal(db, trigram_index, StatusHistory(db))
+        journal.execute([("update", 1, 1, (("material_type", "10", "12"),))])
+        # Сканер додав кількість між редагуванням і скасуванням
+        intake = ScanIntake(db, trigram_index, 1)
+        intake.submit("C1")
+        intake.drain()
+        intake.flush()
+
+        assert journal.undo() == set()
+        assert db.fetch_one("SELECT material_type FROM Materials")[0] == "13"
+        assert errors
+
+    def test_update_of_status_is_recorded_in_history(self, db, journal):
+        add_material(db, "Болт", 1, 10, "C1")
+        journal.execute([("update", 1, 1, (("status", "Справний", "Несправний"),))])
+
+        assert db.fetch_all("SELECT old_status, new_status FROM StatusHistory") == [("Справний", "Несправний")]